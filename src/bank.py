@@ -0,0 +1,106 @@
+import hashlib
+import os
+import struct
+import zipfile
+from typing import Optional, Tuple
+
+import numpy as np
+from numpy import ndarray
+
+from config import *
+from src.helpers import load_ranks, load_suits, build_bank
+from src.models.TemplateBank import TemplateBank
+
+
+def source_hash(filepath: str) -> str:
+    """Hash of every train image used by the bank, together with its name.
+    Only raw file bytes are read, nothing is decoded."""
+
+    sha = hashlib.sha1()
+    for files in (RANK_FILES, SUIT_FILES):
+        for file, name in files.items():
+            sha.update((file + ':' + name + ';').encode())
+            with open(filepath + file + '.jpg', 'rb') as f:
+                sha.update(f.read())
+    return sha.hexdigest()
+
+
+def threshold_bank(bank: TemplateBank) -> TemplateBank:
+    """Bank with templates thresholded to 0 and 255 at the level TemplateBank packs them, which
+    drops gray levels left by JPEG compression and resizing."""
+
+    return TemplateBank(bank.names, np.where(bank.imgs > 127, 255, 0))
+
+
+def build_template_cache(filepath: str, cache_path: Optional[str] = None) -> str:
+    """Decodes train images from filepath once and saves them as one uncompressed .npz with
+    names, thresholded and sized arrays, bank version and content hash. Returns the content hash."""
+
+    if cache_path is None:
+        cache_path = filepath + TEMPLATE_BANK_FILE
+    content_hash = source_hash(filepath)
+    rank_bank = threshold_bank(build_bank(load_ranks(filepath)))
+    suit_bank = threshold_bank(build_bank(load_suits(filepath)))
+
+    # write to temporary file first, so workers starting at the same time never see half written bank
+    tmp_path = cache_path + '.' + str(os.getpid()) + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, version=np.array(TEMPLATE_BANK_VERSION), hash=np.array(content_hash),
+                 rank_names=np.array(rank_bank.names), rank_imgs=rank_bank.imgs,
+                 suit_names=np.array(suit_bank.names), suit_imgs=suit_bank.imgs)
+    os.replace(tmp_path, cache_path)
+    return content_hash
+
+
+def memmap_member(cache_path: str, archive: zipfile.ZipFile, name: str) -> ndarray:
+    """Memory-maps array stored (without compression) in .npz archive, instead of reading it."""
+
+    info = archive.getinfo(name + '.npy')
+    with open(cache_path, 'rb') as f:
+        f.seek(info.header_offset)
+        local_header = f.read(30)
+        name_len, extra_len = struct.unpack('<HH', local_header[26:30])
+        f.seek(info.header_offset + 30 + name_len + extra_len)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    return np.memmap(cache_path, dtype=dtype, mode='r', offset=offset, shape=shape,
+                     order='F' if fortran_order else 'C')
+
+
+def read_template_cache(cache_path: str) -> Tuple[int, str, TemplateBank, TemplateBank]:
+    """Opens bank saved by build_template_cache. Returns its version, content hash and both banks,
+    with images memory-mapped from the file."""
+
+    with np.load(cache_path) as data:
+        version = int(data['version'])
+        content_hash = str(data['hash'])
+        rank_names = [str(name) for name in data['rank_names']]
+        suit_names = [str(name) for name in data['suit_names']]
+    with zipfile.ZipFile(cache_path) as archive:
+        rank_imgs = memmap_member(cache_path, archive, 'rank_imgs')
+        suit_imgs = memmap_member(cache_path, archive, 'suit_imgs')
+    return version, content_hash, TemplateBank(rank_names, rank_imgs), TemplateBank(suit_names, suit_imgs)
+
+
+def load_banks(filepath: str, cache_path: Optional[str] = None) -> Tuple[TemplateBank, TemplateBank]:
+    """Returns rank and suit banks from the precompiled cache (by default bank.npz in filepath).
+    The cache is (re)built only when it is missing, has other version, or train images have changed."""
+
+    if cache_path is None:
+        cache_path = filepath + TEMPLATE_BANK_FILE
+    content_hash = source_hash(filepath)
+    if os.path.exists(cache_path):
+        try:
+            version, cached_hash, rank_bank, suit_bank = read_template_cache(cache_path)
+            if version == TEMPLATE_BANK_VERSION and cached_hash == content_hash:
+                return rank_bank, suit_bank
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            pass  # broken cache is rebuilt below
+
+    build_template_cache(filepath, cache_path)
+    version, cached_hash, rank_bank, suit_bank = read_template_cache(cache_path)
+    return rank_bank, suit_bank
@@ -0,0 +1,112 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional
+
+from src.bank import load_banks
+from src.headless import analyze_video
+from src.main import process_video
+from src.profiling import profiler
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+
+# template banks of this worker process, loaded once by init_worker
+worker_banks = None
+
+
+def init_worker(templates_path: str) -> None:
+    global worker_banks
+    worker_banks = load_banks(templates_path)
+
+
+def run_file(input_path: str, output_dir: Optional[str], headless: bool = False) -> dict:
+    """Processes one recording in worker process, every file gets its own game state. In headless mode
+    only game events are saved (as .jsonl), instead of video with results."""
+    output_path = None
+    if output_dir is not None:
+        output_path = os.path.join(output_dir, os.path.basename(input_path))
+        if headless:
+            output_path = os.path.splitext(output_path)[0] + '.jsonl'
+    rank_bank, suit_bank = worker_banks
+    profiler.reset()
+    try:
+        if headless:
+            summary = analyze_video(input_path, output_path, rank_bank, suit_bank)
+        else:
+            summary = process_video(input_path, output_path, rank_bank, suit_bank)
+    except Exception as e:
+        return {'file': input_path, 'error': repr(e)}
+    if profiler.enabled:
+        summary['profile'] = profiler.summary()
+    return summary
+
+
+def list_videos(source: str) -> List[str]:
+    """Returns recordings from directory, or from manifest file with one path per line
+    (relative paths are relative to manifest, empty lines and lines starting with # are skipped)."""
+
+    if os.path.isdir(source):
+        return sorted(os.path.join(source, name) for name in os.listdir(source)
+                      if name.lower().endswith(VIDEO_EXTENSIONS))
+
+    videos = []
+    base = os.path.dirname(source)
+    with open(source) as f:
+        for line in f:
+            line = line.strip()
+            if len(line) != 0 and not line.startswith('#'):
+                videos.append(os.path.join(base, line))
+    return videos
+
+
+def run_batch(videos: List[str], output_dir: Optional[str], templates_path: str = 'Card_Imgs/',
+              workers: Optional[int] = None, headless: bool = False) -> List[dict]:
+    """Spreads recordings across process pool. Returns summaries in the same order as videos."""
+
+    # build template cache once here, so workers only load it
+    load_banks(templates_path)
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+
+    summaries = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(templates_path,)) as pool:
+        futures = {pool.submit(run_file, video, output_dir, headless): video for video in videos}
+        for future in as_completed(futures):
+            summary = future.result()
+            summaries[futures[future]] = summary
+            print_summary(summary)
+    return [summaries[video] for video in videos]
+
+
+def print_summary(summary: dict) -> None:
+    if 'error' in summary:
+        print(summary['file'] + ': ' + summary['error'])
+    else:
+        print(summary['file'] + ': ' + str(summary['frames']) + ' frames in ' + str(round(summary['wall_time'], 1)) +
+              ' s (' + str(round(summary['fps'], 1)) + ' fps), ' + str(summary['hand_count']) + ' hands')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Detect games on many table recordings at once.')
+    parser.add_argument('source', help='directory with recordings or manifest file with one path per line')
+    parser.add_argument('--output', default=None, help='directory for videos with results (skipped if not given)')
+    parser.add_argument('--headless', action='store_true', help='save only game events, without drawing and video')
+    parser.add_argument('--templates', default='Card_Imgs/', help='directory with train images')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: all cores)')
+    parser.add_argument('--summary', default=None, help='save combined summary as JSON to this file')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = run_batch(list_videos(args.source), args.output, args.templates, args.workers, args.headless)
+    wall = time.perf_counter() - start
+
+    frames = sum(summary.get('frames', 0) for summary in results)
+    hands = sum(summary.get('hand_count', 0) for summary in results)
+    print('Total: ' + str(len(results)) + ' files, ' + str(frames) + ' frames in ' + str(round(wall, 1)) + ' s (' +
+          str(round(frames / wall if wall > 0 else 0.0, 1)) + ' fps), ' + str(hands) + ' hands')
+
+    if args.summary is not None:
+        with open(args.summary, 'w') as f:
+            json.dump({'wall_time': wall, 'frames': frames, 'hands': hands, 'files': results}, f, indent=2)
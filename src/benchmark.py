@@ -0,0 +1,198 @@
+import argparse
+import json
+import sys
+import time
+from typing import List, Optional
+
+import cv2
+import numpy as np
+from numpy import ndarray
+
+from config import *
+from src.bank import load_banks
+from src.helpers import find_cards_in_regions, extract_corner, match_cards
+from src.main import main_logic
+from src.models.TableLayout import default_layout
+from src.models.TableState import TableState
+from src.motion import MotionGate
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def memory_peak_mb() -> Optional[float]:
+    """High-water mark of resident memory of this process."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024  # bytes on macOS, KB elsewhere
+
+
+def load_frame(images_path: str, name: str, size) -> ndarray:
+    if name == 'empty':
+        return np.zeros((size[1], size[0], 3), dtype=np.uint8)
+    image = cv2.imread(images_path + name)
+    if image is None:
+        raise FileNotFoundError('Test image ' + images_path + name + ' was not found')
+    return cv2.resize(image, tuple(size))
+
+
+def score_image(cards, labels: List[dict], tolerance: int) -> dict:
+    """Counts labeled cards found with the right rank and suit (center closer than tolerance),
+    and recognised cards that do not match any label."""
+    correct = rank_ok = suit_ok = 0
+    used = set()
+    for label in labels:
+        best, best_dist = None, tolerance
+        for i, (center, rank, suit) in enumerate(cards):
+            dist = np.hypot(center[0] - label['center'][0], center[1] - label['center'][1])
+            if i not in used and dist < best_dist:
+                best, best_dist = i, dist
+        if best is None:
+            continue
+        used.add(best)
+        center, rank, suit = cards[best]
+        rank_ok += rank == label['rank']
+        suit_ok += suit == label['suit']
+        correct += rank == label['rank'] and suit == label['suit']
+    false = sum(1 for i, (center, rank, suit) in enumerate(cards)
+                if i not in used and (rank != 'Unknown' or suit != 'Unknown'))
+    return {'labeled': len(labels), 'correct': correct, 'rank_correct': rank_ok, 'suit_correct': suit_ok,
+            'false_detections': false}
+
+
+def bench_images(labels: dict, images_path: str, rank_bank, suit_bank, repeat: int,
+                 scale: int = PYRAMID_SCALE) -> dict:
+    """Times preprocess_image -> find_cards -> extract_corner -> match_card on every labeled image,
+    and scores recognition against labels. Cards are searched on frame downscaled scale times."""
+    layout = default_layout()
+    frame_times, card_times = [], []
+    totals = {'labeled': 0, 'correct': 0, 'rank_correct': 0, 'suit_correct': 0, 'false_detections': 0}
+    per_image = {}
+    for name, image_labels in labels['images'].items():
+        frame = load_frame(images_path, name, labels['frame_size'])
+        height, width = frame.shape[:2]
+        for i in range(repeat):
+            start = time.perf_counter()
+            cards = find_cards_in_regions(frame, layout.card_regions(width, height), scale)
+            for card in cards:
+                card_start = time.perf_counter()
+                extract_corner(card, frame)
+                card.best_rank_match, card.best_suit_match, card.rank_diff, card.suit_diff, card.confidence, \
+                    card.margin = match_cards([card], rank_bank, suit_bank)[0]
+                card_times.append(time.perf_counter() - card_start)
+            frame_times.append(time.perf_counter() - start)
+
+        found = [(card.center, card.best_rank_match, card.best_suit_match) for card in cards]
+        per_image[name] = score_image(found, image_labels, labels['center_tolerance'])
+        for key in totals:
+            totals[key] += per_image[name][key]
+
+    frame_ms = np.array(frame_times) * 1000
+    card_ms = np.array(card_times) * 1000 if len(card_times) > 0 else np.zeros(1)
+    return {'fps': len(frame_times) / sum(frame_times),
+            'frame_ms_p50': float(np.percentile(frame_ms, 50)), 'frame_ms_p95': float(np.percentile(frame_ms, 95)),
+            'card_ms_p50': float(np.percentile(card_ms, 50)), 'card_ms_p95': float(np.percentile(card_ms, 95)),
+            'accuracy': totals['correct'] / max(totals['labeled'], 1), **totals, 'images': per_image}
+
+
+def bench_sequence(labels: dict, images_path: str, rank_bank, suit_bank) -> dict:
+    """Runs main_logic (detection, Game updates and drawing) over scripted sequence of frames."""
+    frames = {name: load_frame(images_path, name, labels['frame_size']) for name, count in labels['sequence']}
+    table = TableState(rank_bank, suit_bank)
+    gate = MotionGate()
+    searches = 0
+    start = time.perf_counter()
+    for name, count in labels['sequence']:
+        for i in range(count):
+            search = gate.should_search(frames[name])
+            searches += search
+            main_logic(frames[name].copy(), search, table)
+    wall = time.perf_counter() - start
+    count = sum(count for name, count in labels['sequence'])
+    return {'frames': count, 'searches': searches, 'fps': count / wall, 'hands': list(table.hands),
+            'hand_count': table.hand_count}
+
+
+def bench_pyramid(labels: dict, images_path: str, rank_bank, suit_bank, repeat: int, scale: int) -> dict:
+    """Recognition and speed of cards searched on frame downscaled scale times, against full resolution."""
+    full = bench_images(labels, images_path, rank_bank, suit_bank, repeat, 1)
+    pyramid = bench_images(labels, images_path, rank_bank, suit_bank, repeat, scale)
+    return {'scale': scale, 'full_fps': full['fps'], 'pyramid_fps': pyramid['fps'], 'full_correct': full['correct'],
+            'pyramid_correct': pyramid['correct'], 'lost': full['correct'] - pyramid['correct'],
+            'accuracy_difference': pyramid['accuracy'] - full['accuracy']}
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Returns regressions of result against baseline: fps lower by more than tolerance,
+    or fewer correctly recognised cards."""
+    regressions = []
+    for part in ('images', 'sequence'):
+        old, new = baseline[part]['fps'], result[part]['fps']
+        if new < old * (1 - tolerance):
+            regressions.append(part + ' fps ' + str(round(new, 1)) + ' < ' + str(round(old, 1)))
+    if result['images']['correct'] < baseline['images']['correct']:
+        regressions.append('correct cards ' + str(result['images']['correct']) + ' < ' +
+                           str(baseline['images']['correct']))
+    if 'pyramid' in result and 'pyramid' in baseline and result['pyramid']['scale'] == baseline['pyramid']['scale'] \
+            and result['pyramid']['pyramid_correct'] < baseline['pyramid']['pyramid_correct']:
+        regressions.append('correct cards at scale ' + str(result['pyramid']['scale']) + ' ' +
+                           str(result['pyramid']['pyramid_correct']) + ' < ' +
+                           str(baseline['pyramid']['pyramid_correct']))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure speed and accuracy of detection on Test_Imgs.')
+    parser.add_argument('--labels', default='Test_Imgs/labels.json')
+    parser.add_argument('--templates', default='Card_Imgs/')
+    parser.add_argument('--repeat', type=int, default=5, help='how many times every image is processed')
+    parser.add_argument('--output', default=None, help='save results as JSON to this file')
+    parser.add_argument('--baseline', default=None, help='JSON from earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed relative drop of fps')
+    parser.add_argument('--pyramid', type=int, default=None,
+                        help='also compare cards searched on frame downscaled this many times with full resolution')
+    parser.add_argument('--pyramid-loss', type=int, default=0,
+                        help='correct cards the downscaled search may lose against full resolution')
+    args = parser.parse_args()
+
+    with open(args.labels) as f:
+        labels = json.load(f)
+    images_path = args.labels[:args.labels.rfind('/') + 1]
+    rank_bank, suit_bank = load_banks(args.templates)
+
+    result = {'images': bench_images(labels, images_path, rank_bank, suit_bank, args.repeat),
+              'sequence': bench_sequence(labels, images_path, rank_bank, suit_bank),
+              'memory_peak_mb': memory_peak_mb()}
+    if args.pyramid is not None:
+        result['pyramid'] = bench_pyramid(labels, images_path, rank_bank, suit_bank, args.repeat, args.pyramid)
+    images, sequence = result['images'], result['sequence']
+    print('images: ' + str(round(images['fps'], 1)) + ' fps, ' + str(round(images['card_ms_p50'], 2)) +
+          ' ms per card (p50), ' + str(images['correct']) + '/' + str(images['labeled']) + ' cards correct, ' +
+          str(images['false_detections']) + ' false')
+    print('sequence: ' + str(round(sequence['fps'], 1)) + ' fps, ' + str(sequence['searches']) + ' searches, ' +
+          str(sequence['hand_count']) + ' hands')
+    if 'pyramid' in result:
+        pyramid = result['pyramid']
+        print('pyramid x' + str(pyramid['scale']) + ': ' + str(pyramid['pyramid_correct']) + ' cards correct at ' +
+              str(round(pyramid['pyramid_fps'], 1)) + ' fps, full resolution ' + str(pyramid['full_correct']) +
+              ' at ' + str(round(pyramid['full_fps'], 1)) + ' fps')
+    print('memory peak: ' + str(result['memory_peak_mb']) + ' MB')
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    regressions = []
+    if 'pyramid' in result and result['pyramid']['lost'] > args.pyramid_loss:
+        regressions.append('scale ' + str(args.pyramid) + ' loses ' + str(result['pyramid']['lost']) +
+                           ' correct cards against full resolution')
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions += compare(result, json.load(f), args.tolerance)
+    for regression in regressions:
+        print('REGRESSION: ' + regression)
+    if len(regressions) > 0:
+        sys.exit(1)
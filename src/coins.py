@@ -0,0 +1,87 @@
+from typing import List, Optional
+
+from numpy import ndarray
+
+from config import *
+from src.helpers import preprocess_image, find_coins
+from src.models.Coin import Coin
+from src.models.TableLayout import TableLayout
+from src.motion import MotionGate
+from src.profiling import timed
+from src.spatial import pairwise_distances, greedy_pairs
+
+
+class CoinTracker:
+    """Finds coins in betting strips of all players and follows them between searches. Strip is
+    thresholded and searched with Hough again only when it has changed since its last search (compared
+    downscaled, as in MotionGate), or after COIN_REFRESH searches. Otherwise its coins from last search are kept.
+    Coin found near a coin the game kept from last search (one to one, closest first) keeps its id, so a coin
+    missed by one search (and restored by the game) keeps it too."""
+
+    def __init__(self, refresh: int = COIN_REFRESH, max_move: float = COIN_TRACK_PX):
+        self.refresh = refresh
+        self.max_move = max_move
+        self.gates: List[MotionGate] = []  # only reference image and comparison are used, one per strip
+        self.coins: List[List[Coin]] = []  # coins of every strip from its last search
+        self.since_search: List[int] = []  # searches since strip was last searched
+        self.next_id = 0
+        self.searched = 0  # strips searched with Hough so far
+        self.reused = 0  # strips that kept their coins
+
+    def resume(self, coins: List[List[Coin]]) -> None:
+        """Continues following coins of every strip (e.g. of restored game), all strips are searched again."""
+        self.gates = [MotionGate() for _ in coins]
+        self.coins = [list(strip) for strip in coins]
+        self.since_search = [0] * len(coins)
+        ids = [coin.coin_id for strip in coins for coin in strip if coin.coin_id is not None]
+        self.next_id = max(ids) + 1 if len(ids) > 0 else 0
+
+    def changed(self, strip: int, region: ndarray) -> Optional[ndarray]:
+        """Small image of strip region when strip has to be searched again, None otherwise."""
+        gate = self.gates[strip]
+        small = gate.small(region)
+        if gate.reference is None or gate.reference.shape != small.shape or self.since_search[strip] >= self.refresh:
+            return small
+        if gate.motion(small) >= gate.area:
+            return small
+        return None
+
+    def follow(self, prev: List[Coin], found: List[Coin]) -> None:
+        """Gives found coins ids of previous coins they continue, and new ids to others."""
+        pairs = greedy_pairs(pairwise_distances([coin.pos[:2] for coin in found], [coin.pos[:2] for coin in prev]),
+                             self.max_move)
+        for coin, j in zip(found, pairs):
+            if j >= 0:
+                coin.coin_id = prev[j].coin_id
+            else:
+                coin.coin_id = self.next_id
+                self.next_id += 1
+
+    @timed('track_coins')
+    def update(self, image: ndarray, layout: TableLayout, scale: int = PYRAMID_SCALE,
+               kept: Optional[List[List[Coin]]] = None) -> List[List[Coin]]:
+        """Coins of betting strip of every player, in camera image coordinates. kept are coins of every strip
+        the game has kept from last search (found and restored ones), found coins continue them."""
+        height, width = image.shape[:2]
+        strips = layout.coin_strips(width, height)
+        while len(self.gates) < len(strips):
+            self.gates.append(MotionGate())
+            self.coins.append([])
+            self.since_search.append(0)
+
+        for i, (strip, (x, y, w, h)) in enumerate(strips):
+            if strip[2] <= 0 or strip[3] <= 0 or w <= 0 or h <= 0:
+                continue  # player without betting strip
+            region = image[y:y + h, x:x + w]
+            small = self.changed(i, region)
+            if small is None:
+                self.since_search[i] += 1
+                self.reused += 1
+            else:
+                found = find_coins(preprocess_image(region, scale), (x, y), strip, scale)
+                self.follow(kept[i] if kept is not None and i < len(kept) else self.coins[i], found)
+                self.coins[i] = found
+                self.gates[i].reference = small
+                self.since_search[i] = 0
+                self.searched += 1
+        return [list(coins) for coins in self.coins[:len(strips)]]
@@ -6,6 +6,10 @@ IM_HEIGHT = 1080
 BKG_THRESH = 60
 CARD_THRESH = 30
 
+# Cards are flattened to this size
+FLAT_WIDTH = 200
+FLAT_HEIGHT = 300
+
 # Width and height of card corner, where rank and suit are
 CORNER_WIDTH = 32
 CORNER_HEIGHT = 84
@@ -20,7 +24,103 @@ SUIT_HEIGHT = 100
 
 RANK_DIFF_MAX = 2000
 SUIT_DIFF_MAX = 700
+MATCH_CANDIDATES = 3  # templates closest by Hamming distance of binarized images, that are compared exactly
 
 CARD_MAX_AREA = 150000
 CARD_MIN_AREA = 50000
 
+# Cards and coins are searched on frame downscaled this many times (1, 2 or 4),
+# cards are still warped from full resolution frame
+PYRAMID_SCALE = 1
+
+
+# Train image files (without .jpg) and names of ranks/suits they show
+RANK_FILES = {'Ace': 'Ace', 'Two': 'Two', 'Three': 'Three', 'Four': 'Four', 'Five': 'Five', 'Six': 'Six',
+              'Seven': 'Seven', 'Eight': 'Eight', 'Nine': 'Nine', 'Ten': 'Ten', 'Jack': 'Jack', 'Queen': 'Queen',
+              'King': 'King', 'Queen2': 'Queen', 'Six2': 'Six'}
+SUIT_FILES = {'Spades': 'Spades', 'Diamonds': 'Diamonds', 'Clubs': 'Clubs', 'Hearts': 'Hearts', 'Clubs2': 'Clubs'}
+
+# Precompiled template bank (saved next to train images), rebuilt when train images change
+TEMPLATE_BANK_FILE = 'bank.npz'
+TEMPLATE_BANK_VERSION = 2
+
+# Search cadence. Durations in game are given in frames, as multiplies of cadence they were tuned for
+SEARCH_INTERVAL = 15
+ACTION_FRAMES = 5 * SEARCH_INTERVAL  # how long action is shown
+LONG_ACTION_FRAMES = 10 * SEARCH_INTERVAL
+NEW_GAME_FRAMES = 9 * SEARCH_INTERVAL  # no points during 10 searches means new game
+WINNERS_FRAMES = 12 * SEARCH_INTERVAL  # how long winners are shown
+ACTION_HISTORY = 32  # actions kept by game, shown or not, older are forgotten
+HAND_HISTORY = 1000  # winners of last hands kept by table
+
+# Motion gate, search runs at once when table changes, and backs off up to max interval when it does not
+SEARCH_MIN_INTERVAL = 5
+SEARCH_MAX_INTERVAL = 30
+MOTION_SCALE = 8  # frame is downscaled this many times before comparing
+MOTION_PIXEL_THRESH = 25  # change of gray level that counts as motion
+MOTION_AREA = 0.005  # fraction of changed pixels that counts as significant motion
+
+# Table layout, polygons are [(x, y), ...] of pixels in full frame coordinates, borders included.
+# Every seat has name, polygon where its cards lie, betting strip (x, y, width, height) where centers of its
+# coins lie, and position of its labels. Dealer is first and has no bets, at most MAX_PLAYERS players follow.
+# Shoe holds the deck, hole the dealer's face down card (counted to the dealer once turned), discard used cards.
+# Card lying in more zones belongs to the first of: shoe, hole, discard, seats in order.
+# Cards are searched only inside bounding rectangles of all zones. Zones below cover the whole frame (as the halves
+# of the frame did before), so cards are still thresholded everywhere, only narrower zones of a real table save work.
+# Betting strips are always searched on their own.
+TABLE_SPEC = {
+    'seats': [
+        {'name': 'Dealer', 'polygon': [(IM_WIDTH // 2 + 1, IM_HEIGHT // 2 + 1), (IM_WIDTH - 1, IM_HEIGHT // 2 + 1),
+                                       (IM_WIDTH - 1, IM_HEIGHT - 1), (IM_WIDTH // 2 + 1, IM_HEIGHT - 1)],
+         'label': (IM_WIDTH // 2, IM_HEIGHT // 2 + 20)},
+        {'name': 'Player1', 'polygon': [(0, 0), (IM_WIDTH // 2, 0), (IM_WIDTH // 2, IM_HEIGHT // 2),
+                                        (0, IM_HEIGHT // 2)],
+         'bet': (0, 0, IM_WIDTH // 2 + 1, 150), 'label': (30, 60)},
+        {'name': 'Player2', 'polygon': [(IM_WIDTH // 2 + 1, 0), (IM_WIDTH - 1, 0), (IM_WIDTH - 1, IM_HEIGHT // 2),
+                                        (IM_WIDTH // 2 + 1, IM_HEIGHT // 2)],
+         'bet': (IM_WIDTH // 2 + 1, 0, IM_WIDTH // 2 - 1, 150), 'label': (IM_WIDTH // 2, 60)},
+    ],
+    'shoe': [(0, IM_HEIGHT // 2 + 1), (IM_WIDTH // 4 - 1, IM_HEIGHT // 2 + 1), (IM_WIDTH // 4 - 1, IM_HEIGHT - 1),
+             (0, IM_HEIGHT - 1)],
+    'hole': [(IM_WIDTH // 4, IM_HEIGHT // 2 + 1), (IM_WIDTH // 2, IM_HEIGHT // 2 + 1), (IM_WIDTH // 2, IM_HEIGHT - 1),
+             (IM_WIDTH // 4, IM_HEIGHT - 1)],
+    'discard': [],
+}
+TABLE_SPEC_FILE = None  # JSON file with the same structure, loaded instead of TABLE_SPEC
+MAX_PLAYERS = 7
+THRESH_BLOCK = 91  # block of adaptive threshold, zones are padded with half of it
+COIN_MIN_RADIUS = 50
+COIN_MAX_RADIUS = 70
+COIN_REFRESH = 10  # betting strip which did not change is anyway searched again after this many searches
+COIN_TRACK_PX = 30  # coin found closer than this to coin of previous search keeps its id
+
+# Card tracker, cards which did not move keep their rank and suit without matching
+TRACK_MIN_IOU = 0.5  # overlap of bounding rectangles needed to continue a track
+TRACK_MOVE_PX = 6  # card with corner moved more than this is matched again
+TRACK_MIN_CONFIDENCE = 0.25  # match with higher confidence (see score_matches) and margin is not repeated
+TRACK_MIN_MARGIN = 0.05
+TRACK_REFRESH = 10  # confident card is anyway matched again after this many searches
+TRACK_MAX_MISSES = 2  # searches in which card can be missing before its track is dropped
+
+# Cards and coins missing in search are restored from previous one, unless something found is near them
+RESTORE_ONE_TO_ONE = False  # pair previous and found ones one to one, so two previous cannot share one found
+
+# Profiling of pipeline stages (see src/profiling.py)
+PROFILE = False
+PROFILE_WINDOW = 1000  # percentiles are computed over this many last calls of every stage
+PROFILE_REPORT = 'output/profile.json'  # .json or .csv
+PROFILE_FRAMES = []  # frames to capture with cProfile
+PROFILE_CAPTURE = 'output/profile.prof'
+
+# Game events (see src/events.py), written by background thread so detection never waits for disk
+EVENT_QUEUE_SIZE = 10000  # events waiting for writer, newer ones are dropped (and counted) when full
+EVENT_FLUSH_SECONDS = 1.0  # file sinks are flushed at least this often
+EVENT_RING_SIZE = 1000  # events kept by in-memory sink
+
+# Overlay, rendered labels kept for reuse between frames
+OVERLAY_CACHE_SIZE = 256
+
+# Multi-table server (see src/server.py)
+SERVER_WORKERS = 4  # threads doing detection, shared by all tables
+SERVER_QUEUE_SIZE = 2  # frames waiting for detection per table, older ones are dropped when table falls behind
+FRAME_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')  # directory of such images can stand in for a camera
@@ -0,0 +1,232 @@
+import json
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import List
+
+from config import *
+from src.models.GameEvent import GameEvent, EVENT_TEXTS
+
+END = None  # put in queue after last event
+
+EVENT_KINDS = list(EVENT_TEXTS)
+CARD_RANKS = list(dict.fromkeys(RANK_FILES.values())) + ['Unknown']
+CARD_SUITS = list(dict.fromkeys(SUIT_FILES.values())) + ['Unknown']
+
+BINARY_MAGIC = b'BJEV'
+BINARY_VERSION = 3
+RECORD = struct.Struct('<BIfhh')  # kind, frame, time, points and chips (-1 when none)
+NAME = struct.Struct('<H')  # length of player name
+
+
+class EventSink:
+    """Receives game events. write() is called from detection loop, so it must be cheap."""
+
+    def __init__(self):
+        self.count = 0  # events written
+
+    def write(self, event: GameEvent) -> None:
+        self.count += 1
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.flush()
+
+
+class RingBufferSink(EventSink):
+    """Keeps last `size` events in memory, e.g. for live overlay or tests."""
+
+    def __init__(self, size: int = EVENT_RING_SIZE):
+        super().__init__()
+        self.buffer = deque(maxlen=size)
+
+    def write(self, event: GameEvent) -> None:
+        super().write(event)
+        self.buffer.append(event)
+
+    def events(self) -> List[GameEvent]:
+        return list(self.buffer)
+
+
+class FileSink(EventSink, ABC):
+    """Appends events to buffered file (which is truncated first, unless append is set),
+    and flushes it at least every flush_seconds. Subclasses encode events."""
+
+    binary = False
+
+    def __init__(self, path: str, append: bool = True, flush_seconds: float = EVENT_FLUSH_SECONDS):
+        super().__init__()
+        self.file = open(path, ('a' if append else 'w') + ('b' if self.binary else ''))
+        self.flush_seconds = flush_seconds
+        self.last_flush = time.monotonic()
+
+    def write(self, event: GameEvent) -> None:
+        super().write(event)
+        self.file.write(self.encode(event))
+        if time.monotonic() - self.last_flush >= self.flush_seconds:
+            self.flush()
+
+    @abstractmethod
+    def encode(self, event: GameEvent):
+        """Event as str, or bytes when binary is set."""
+
+    def flush(self) -> None:
+        self.file.flush()
+        self.last_flush = time.monotonic()
+
+    def close(self) -> None:
+        self.flush()
+        self.file.close()
+
+
+class JsonlSink(FileSink):
+    """One JSON object per line."""
+
+    def encode(self, event: GameEvent) -> str:
+        return json.dumps(event.to_dict()) + '\n'
+
+
+class StdoutSink(JsonlSink):
+    """JSON lines on standard output, which stays open."""
+
+    def __init__(self, flush_seconds: float = EVENT_FLUSH_SECONDS):
+        EventSink.__init__(self)
+        self.file = sys.stdout
+        self.flush_seconds = flush_seconds
+        self.last_flush = time.monotonic()
+
+    def close(self) -> None:
+        self.flush()
+
+
+class BinarySink(FileSink):
+    """Compact records: kind, frame, time, points and chips in 13 bytes, then player name prefixed by its
+    length (2 bytes) and cards as (rank, suit) byte pairs. New file starts with magic and version, records
+    are appended only to a file of the same version."""
+
+    binary = True
+
+    def __init__(self, path: str, append: bool = True, flush_seconds: float = EVENT_FLUSH_SECONDS):
+        if append and os.path.isfile(path) and os.path.getsize(path) > 0:
+            with open(path, 'rb') as f:
+                check_header(f.read(len(BINARY_MAGIC) + 1), path)
+        super().__init__(path, append, flush_seconds)
+        if self.file.seekable() and self.file.tell() == 0:
+            self.file.write(BINARY_MAGIC + bytes([BINARY_VERSION]))
+
+    def encode(self, event: GameEvent) -> bytes:
+        player = event.player.encode() if event.player is not None else b''
+        cards = bytes(code for rank, suit in event.cards for code in
+                      (index_of(CARD_RANKS, rank), index_of(CARD_SUITS, suit)))
+        points = event.points if event.points is not None else -1
+        chips = event.chips if event.chips is not None else -1
+        return (RECORD.pack(EVENT_KINDS.index(event.kind), event.frame, event.time, points, chips) +
+                NAME.pack(len(player)) + player + bytes([len(event.cards)]) + cards)
+
+
+def index_of(names: List[str], name: str) -> int:
+    return names.index(name) if name in names else len(names) - 1  # anything else is Unknown
+
+
+def check_header(data: bytes, path: str) -> None:
+    if len(data) <= len(BINARY_MAGIC) or data[:len(BINARY_MAGIC)] != BINARY_MAGIC or \
+            data[len(BINARY_MAGIC)] != BINARY_VERSION:
+        raise ValueError(path + ' is not event file of version ' + str(BINARY_VERSION))
+
+
+def read_binary_events(path: str) -> List[GameEvent]:
+    with open(path, 'rb') as f:
+        data = f.read()
+    check_header(data, path)
+
+    events = []
+    pos = len(BINARY_MAGIC) + 1
+    try:
+        while pos < len(data):
+            kind, frame, seconds, points, chips = RECORD.unpack_from(data, pos)
+            pos += RECORD.size
+            length, = NAME.unpack_from(data, pos)
+            pos += NAME.size
+            player = data[pos:pos + length].decode() if length > 0 else None
+            pos += length
+            count = data[pos]
+            cards = [(CARD_RANKS[data[pos + 1 + 2 * i]], CARD_SUITS[data[pos + 2 + 2 * i]]) for i in range(count)]
+            pos += 1 + 2 * count
+            events.append(GameEvent(EVENT_KINDS[kind], frame, seconds, player, cards,
+                                    points if points >= 0 else None, chips if chips >= 0 else None))
+    except (struct.error, IndexError):
+        raise ValueError(path + ' ends with truncated event')
+    return events
+
+
+def read_jsonl_events(path: str) -> List[GameEvent]:
+    with open(path) as f:
+        return [GameEvent.from_dict(json.loads(line)) for line in f if len(line.strip()) > 0]
+
+
+class AsyncSink(EventSink):
+    """Hands events to another sink running in background thread. write() never blocks: when the
+    writer falls behind by queue_size events, new events are dropped and counted."""
+
+    def __init__(self, sink: EventSink, queue_size: int = EVENT_QUEUE_SIZE,
+                 flush_seconds: float = EVENT_FLUSH_SECONDS):
+        super().__init__()
+        self.sink = sink
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.flush_seconds = flush_seconds
+        self.dropped = 0
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def write(self, event: GameEvent) -> None:
+        try:
+            self.queue.put_nowait(event)
+            self.count += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self) -> None:
+        try:
+            while True:
+                try:
+                    event = self.queue.get(timeout=self.flush_seconds)
+                except queue.Empty:
+                    self.sink.flush()  # nothing happens, make sure last events are on disk
+                    continue
+                if event is END:
+                    break
+                self.sink.write(event)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.sink.close()
+
+    def close(self) -> None:
+        """Writes all queued events and closes wrapped sink."""
+        while self.thread.is_alive():
+            try:
+                self.queue.put(END, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+def open_sink(path: str, append: bool = False) -> EventSink:
+    """Background sink writing to file, binary when path ends with .bin, otherwise JSON lines,
+    or JSON lines to standard output when path is '-'."""
+    if path == '-':
+        return AsyncSink(StdoutSink())
+    if path.endswith('.bin'):
+        return AsyncSink(BinarySink(path, append))
+    return AsyncSink(JsonlSink(path, append))
@@ -0,0 +1,50 @@
+from typing import List
+
+import cv2
+import numpy as np
+from numpy import ndarray
+
+from config import *
+from src.helpers import corner_transform, threshold_corner, split_corner
+from src.models.QueryCard import QueryCard
+from src.profiling import timed
+
+ZOOM = 4  # corner is zoomed this many times before thresholding
+
+
+class CornerExtractor:
+    """Does extract_corner for all cards of a search at once. Only corners are warped, into buffers
+    that are kept between searches (and grown when there are more cards than ever before)."""
+
+    def __init__(self, capacity: int = 8):
+        self.capacity = 0
+        self.allocate(capacity)
+
+    def allocate(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.color = np.empty((capacity, CORNER_HEIGHT, CORNER_WIDTH, 3), dtype=np.uint8)
+        self.gray = np.empty((capacity, CORNER_HEIGHT, CORNER_WIDTH), dtype=np.uint8)
+        self.zoom = np.empty((capacity, CORNER_HEIGHT * ZOOM, CORNER_WIDTH * ZOOM), dtype=np.uint8)
+        self.thresh = np.empty((capacity, CORNER_HEIGHT * ZOOM, CORNER_WIDTH * ZOOM), dtype=np.uint8)
+
+    @timed('extract_corners')
+    def extract(self, q_cards: List[QueryCard], image: ndarray) -> List[QueryCard]:
+        """Warps corners of all cards, grays them with one call and isolates rank and suit images."""
+        n = len(q_cards)
+        if n == 0:
+            return q_cards
+        if n > self.capacity:
+            self.allocate(max(n, 2 * self.capacity))
+
+        for i, q_card in enumerate(q_cards):
+            cv2.warpPerspective(image, corner_transform(q_card), (CORNER_WIDTH, CORNER_HEIGHT), dst=self.color[i])
+        # corners lie one under another in the buffer, so they are grayed as one image
+        cv2.cvtColor(self.color[:n].reshape(n * CORNER_HEIGHT, CORNER_WIDTH, 3), cv2.COLOR_BGR2GRAY,
+                     dst=self.gray[:n].reshape(n * CORNER_HEIGHT, CORNER_WIDTH))
+
+        for i, q_card in enumerate(q_cards):
+            cv2.resize(self.gray[i], (CORNER_WIDTH * ZOOM, CORNER_HEIGHT * ZOOM), dst=self.zoom[i])
+            threshold_corner(self.zoom[i], self.thresh[i])
+            q_card.warp = self.gray[i].copy()  # buffer is overwritten in next search, card can live longer
+            split_corner(q_card, self.thresh[i])
+        return q_cards
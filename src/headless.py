@@ -0,0 +1,83 @@
+import argparse
+import time
+from typing import Optional
+
+import cv2
+
+from src.bank import load_banks
+from src.events import open_sink, EventSink
+from src.main import next_frame, search_table, update_winners
+from src.models.TableState import TableState
+from src.models.TemplateBank import TemplateBank
+from src.motion import MotionGate
+from src.session import SessionIndexWriter
+
+
+def analyze_video(input_path: str, events_path: Optional[str], rank_bank: TemplateBank,
+                  suit_bank: TemplateBank, index_path: Optional[str] = None) -> dict:
+    """Extracts game events from video without drawing or writing any frames. Frames which MotionGate
+    does not look at are only grabbed, never retrieved. Events are written to events_path
+    (JSON lines, or binary when it ends with .bin), session index for replay (see src/session.py)
+    to index_path."""
+
+    start = time.perf_counter()
+    cap = cv2.VideoCapture(input_path)
+    if not cap.isOpened() or int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) <= 0:
+        cap.release()
+        return {'file': input_path, 'error': 'Video was not found'}
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+
+    sink = open_sink(events_path) if events_path is not None else EventSink()
+    table = TableState(rank_bank, suit_bank, sink=sink, fps=fps)
+    index = SessionIndexWriter(index_path, input_path, fps, table.layout.seat_names) if index_path is not None else None
+    gate = MotionGate()
+    retrieved = searches = 0
+    try:
+        while cap.grab():
+            next_frame(table)
+            if not gate.needs_frame():
+                gate.skip()
+                continue
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            retrieved += 1
+            if not gate.should_search(frame):
+                continue
+
+            searches += 1
+            search_table(frame, table)
+            update_winners(table)
+            if index is not None:
+                index.add(table, cap.get(cv2.CAP_PROP_POS_MSEC))
+    finally:
+        cap.release()
+        sink.close()
+        if index is not None:
+            index.close(table.frames)
+
+    wall = time.perf_counter() - start
+    return {'file': input_path, 'frames': table.frames, 'retrieved': retrieved, 'searches': searches,
+            'events': sink.count, 'events_dropped': getattr(sink, 'dropped', 0), 'wall_time': wall,
+            'fps': table.frames / wall if wall > 0 else 0.0,
+            'hands': list(table.hands), 'hand_count': table.hand_count}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Extract game events from recording, without rendering.')
+    parser.add_argument('video')
+    parser.add_argument('--events', default=None,
+                        help='file for events, .bin for binary, otherwise JSON lines (default: print them)')
+    parser.add_argument('--index', default=None, help='session index for replay of single hands (see src/session.py)')
+    parser.add_argument('--templates', default='Card_Imgs/', help='directory with train images')
+    args = parser.parse_args()
+
+    rank_bank, suit_bank = load_banks(args.templates)
+    events_path = args.events if args.events is not None else '-'
+    summary = analyze_video(args.video, events_path, rank_bank, suit_bank, args.index)
+    if 'error' in summary:
+        print(summary['error'])
+    else:
+        print(str(summary['frames']) + ' frames (' + str(summary['retrieved']) + ' decoded, ' +
+              str(summary['searches']) + ' searched) in ' + str(round(summary['wall_time'], 1)) + ' s, ' +
+              str(summary['events']) + ' events')
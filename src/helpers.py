@@ -8,96 +8,157 @@ from numpy import ndarray
 from models.TrainRanks import TrainRanks
 from src.models.Coin import Coin
 from src.models.QueryCard import QueryCard
+from src.models.TemplateBank import TemplateBank, pack_images
 from src.models.TrainSuits import TrainSuits
+from src.profiling import timed
 from config import *
 
 
+def read_train_image(filepath: str, filename: str, width: int, height: int) -> ndarray:
+    """Reads one grayscale train image and makes sure it has size expected by matcher.
+    Raises FileNotFoundError instead of returning None for missing file."""
+
+    img = cv2.imread(filepath + filename, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        raise FileNotFoundError('Train image ' + filepath + filename + ' was not found')
+    if img.shape != (height, width):
+        img = cv2.resize(img, (width, height))
+    return img
+
+
 def load_ranks(filepath: str) -> List[TrainRanks]:
     """Loads rank images from directory specified by filepath. Stores
     them in a list of TrainRanks objects."""
 
     train_ranks = []
-    for i, rank in enumerate(['Ace', 'Two', 'Three', 'Four', 'Five', 'Six', 'Seven',
-                              'Eight', 'Nine', 'Ten', 'Jack', 'Queen', 'King', 'Queen2', 'Six2']):
+    for i, (rank, name) in enumerate(RANK_FILES.items()):
         train_ranks.append(TrainRanks())
-        if rank != 'Queen2' and rank != 'Six2':
-            train_ranks[i].name = rank
-        else:
-            train_ranks[i].name = rank[:-1]
-        filename = rank + '.jpg'
-        train_ranks[i].img = cv2.imread(filepath + filename, cv2.IMREAD_GRAYSCALE)
+        train_ranks[i].name = name
+        train_ranks[i].img = read_train_image(filepath, rank + '.jpg', RANK_WIDTH, RANK_HEIGHT)
 
     return train_ranks
 
 
-def load_suits(filepath: str) -> TrainSuits:
+def load_suits(filepath: str) -> List[TrainSuits]:
     """Loads suit images from directory specified by filepath. Stores
     them in a list of TrainSuits objects."""
 
     train_suits = []
-    for i, suit in enumerate(['Spades', 'Diamonds', 'Clubs', 'Hearts', 'Clubs2']):
+    for i, (suit, name) in enumerate(SUIT_FILES.items()):
         train_suits.append(TrainSuits())
-        if suit != 'Clubs2':
-            train_suits[i].name = suit
-        else:
-            train_suits[i].name = 'Clubs'
-        filename = suit + '.jpg'
-        train_suits[i].img = cv2.imread(filepath + filename, cv2.IMREAD_GRAYSCALE)
+        train_suits[i].name = name
+        train_suits[i].img = read_train_image(filepath, suit + '.jpg', SUIT_WIDTH, SUIT_HEIGHT)
     return train_suits
 
 
-def preprocess_image(image: ndarray) -> ndarray:
-    """Returns a grayed, blurred, and adaptively thresholded camera image."""
+def build_bank(train_set: List[TrainRanks]) -> TemplateBank:
+    """Stacks train images (ranks or suits) into one contiguous TemplateBank,
+    so a card can be compared with every template in a single operation."""
+
+    names = [element.name for element in train_set]
+    imgs = np.stack([element.img for element in train_set])
+    return TemplateBank(names, imgs)
+
+
+@timed('preprocess_image')
+def preprocess_image(image: ndarray, scale: int = 1) -> ndarray:
+    """Returns a grayed, blurred, and adaptively thresholded camera image.
+    With scale > 1 image is first downscaled scale times, and threshold block with it."""
 
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    block = THRESH_BLOCK
+    if scale > 1:
+        h, w = gray.shape
+        gray = cv2.resize(gray, (max(1, w // scale), max(1, h // scale)), interpolation=cv2.INTER_AREA)
+        block = max(3, (THRESH_BLOCK // scale) | 1)  # block size has to be odd
     # TODO
     # blur = cv2.GaussianBlur(gray, (9, 9), 0)
-    thresh = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 91, 8)
+    thresh = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, block, 8)
 
     return thresh
 
 
-def find_cards(thresh_image: ndarray) -> List[ndarray]:
+@timed('find_cards')
+def find_cards(thresh_image: ndarray, scale: int = 1) -> List[ndarray]:
     """Finds all card-sized contours in a thresholded camera image.
-    Returns the number of cards, and a list of card contours sorted
-    from largest to smallest."""
+    Returns a list of card contours. Card areas are scaled down for image
+    downscaled scale times."""
+
+    return [cnt for cnt, approx, size in find_card_shapes(thresh_image, scale)]
+
+
+def find_card_shapes(thresh_image: ndarray, scale: int = 1) -> List[Tuple[ndarray, ndarray, float]]:
+    """Like find_cards, but returns (contour, approximated corners, area) of each card,
+    so the geometry computed for filtering does not have to be computed again."""
 
     # Find contours and sort their indices by contour size
     cnts, hier = cv2.findContours(thresh_image, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
 
     # If there are no contours, do nothing
     if len(cnts) == 0:
-        return [], []
+        return []
 
     # Determine which of the contours are cards by applying the
     # following criteria: 1) Smaller area than the maximum card size,
     # 2), bigger area than the minimum card size, 3) have no parents,
     # and 4) have four corners
-    finnal_cnts = []
+    max_area = CARD_MAX_AREA / scale ** 2
+    min_area = CARD_MIN_AREA / scale ** 2
+    shapes = []
     for i in range(len(cnts)):
         size = cv2.contourArea(cnts[i])
-        peri = cv2.arcLength(cnts[i], True)
-        approx = cv2.approxPolyDP(cnts[i], 0.01 * peri, True)
-        if (size < CARD_MAX_AREA) and (size > CARD_MIN_AREA) and (len(approx) == 4):  # and (hier[0][i][3] == -1 )):
-            finnal_cnts.append(cnts[i])
-    return finnal_cnts
-
-
+        if (size < max_area) and (size > min_area):
+            peri = cv2.arcLength(cnts[i], True)
+            approx = cv2.approxPolyDP(cnts[i], 0.01 * peri, True)
+            if len(approx) == 4:  # and (hier[0][i][3] == -1 )):
+                shapes.append((cnts[i], approx, size))
+    return shapes
+
+
+def find_cards_in_regions(image: ndarray, regions: List[Tuple[int, int, int, int]], scale: int = 1) -> \
+        List[QueryCard]:
+    """Thresholds and searches for cards only inside given regions (x, y, width, height) of camera image.
+    With scale > 1 search runs on regions downscaled scale times. Returns cards with geometry in
+    coordinates of the whole (full resolution) image, so cards are still warped from full resolution frame."""
+
+    cards = []
+    for x, y, w, h in regions:
+        thresh = preprocess_image(image[y:y + h, x:x + w], scale)
+        for cnt, approx, size in find_card_shapes(thresh, scale):
+            # scale back to the middle of downscaled pixel
+            shift = np.array([x + scale // 2, y + scale // 2], dtype=cnt.dtype)
+            cards.append(card_geometry(cnt * scale + shift, approx * scale + shift, size * scale ** 2))
+    return cards
+
+
+@timed('preprocess_card')
 def preprocess_card(contour: ndarray, image: ndarray, show: bool = True) -> QueryCard:
     """Uses contour to find information about the query card. Isolates rank
         and suit images from the card."""
 
+    q_card = card_geometry(contour)
+    extract_corner(q_card, image)
+    return q_card
+
+
+@timed('card_geometry')
+def card_geometry(contour: ndarray, approx: ndarray = None, size: float = None) -> QueryCard:
+    """Cheap part of preprocess_card: size, corner points, center and position of the card,
+    without warping it. Corners and size already found by find_card_shapes can be given."""
+
     # Initialize new QueryCard object
     q_card = QueryCard()
     q_card.contour = contour
 
     # save size for future
-    size = cv2.contourArea(contour)
+    if size is None:
+        size = cv2.contourArea(contour)
     q_card.size = size
 
     # Find perimeter of card and use it to approximate corner points
-    peri = cv2.arcLength(contour, True)
-    approx = cv2.approxPolyDP(contour, 0.01 * peri, True)
+    if approx is None:
+        peri = cv2.arcLength(contour, True)
+        approx = cv2.approxPolyDP(contour, 0.01 * peri, True)
     pts = np.float32(approx)
     q_card.corner_pts = pts
 
@@ -109,36 +170,37 @@ def preprocess_card(contour: ndarray, image: ndarray, show: bool = True) -> Quer
     average = np.sum(pts, axis=0) / len(pts)
     cent_x = int(average[0][0])
     cent_y = int(average[0][1])
-    q_card.center = [cent_x, cent_y]
+    q_card.center = [cent_x, cent_y]  # zone of the table is looked up by it (see TableLayout.zone_of)
+    return q_card
+
 
-    if cent_y > IM_HEIGHT / 2:
-        q_card.half = 'bottom'
-    else:
-        q_card.half = 'top'
+@timed('extract_corner')
+def extract_corner(q_card: QueryCard, image: ndarray) -> QueryCard:
+    """Expensive part of preprocess_card: warps the corner of the card and isolates rank and suit images from it."""
 
-    if cent_x > IM_WIDTH / 2:
-        q_card.side = 'right'
-    else:
-        q_card.side = 'left'
+    # Warp only the corner of card flattened to 200x300, that is all we need
+    corner = cv2.warpPerspective(image, corner_transform(q_card), (CORNER_WIDTH, CORNER_HEIGHT))
+    q_card.warp = cv2.cvtColor(corner, cv2.COLOR_BGR2GRAY)
 
-    # Warp card into 200x300 flattened image using perspective transform
-    q_card.warp = flattener(image, pts, w, h)
+    # Do a 4x zoom of the corner
+    q_corner_zoom = cv2.resize(q_card.warp, (0, 0), fx=4, fy=4)
+    split_corner(q_card, threshold_corner(q_corner_zoom))
+    return q_card
 
-    # Grab corner of warped card image and do a 4x zoom
-    q_corner = q_card.warp[0:CORNER_HEIGHT, 0:CORNER_WIDTH]
-    q_corner_zoom = cv2.resize(q_corner, (0, 0), fx=4, fy=4)
 
-    # Sample known white pixel intensity to determine good threshold level
+def threshold_corner(q_corner_zoom: ndarray, dst: ndarray = None) -> ndarray:
     # this adaptiveThreshold may need some tunning
-    query_thresh = cv2.adaptiveThreshold(q_corner_zoom, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 91,
-                                         8)
-    # Split in to top and bottom half (top shows rank, bottom shows suit)
+    return cv2.adaptiveThreshold(q_corner_zoom, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 91, 8,
+                                 dst=dst)
+
+
+def split_corner(q_card: QueryCard, query_thresh: ndarray) -> None:
+    """Split thresholded corner in to top and bottom half (top shows rank, bottom shows suit)"""
     q_rank = query_thresh[20:195, 0:128]
     q_suit = query_thresh[195:336, 0:128]
 
     q_card.rank_img = find_bounds(q_rank, RANK_WIDTH, RANK_HEIGHT)  # Qrank_sized
     q_card.suit_img = find_bounds(q_suit, SUIT_WIDTH, SUIT_HEIGHT)
-    return q_card
 
 
 def find_bounds(q: ndarray, width: int, height: int) -> ndarray:
@@ -155,6 +217,7 @@ def find_bounds(q: ndarray, width: int, height: int) -> ndarray:
     return []
 
 
+@timed('match_card')
 def match_card(q_card: QueryCard, train_ranks: List[TrainRanks], train_suits: List[TrainSuits]) -> \
         Tuple[str, str, int, int]:
     """Finds best rank and suit matches for the query card. Differences
@@ -187,37 +250,144 @@ def match_card(q_card: QueryCard, train_ranks: List[TrainRanks], train_suits: Li
     return best_rank_match_name, best_suit_match_name, best_rank_match_diff, best_suit_match_diff
 
 
-def find_most_simmilar(image: ndarray, train_set: List[TrainRanks]) -> Tuple[str, int]:
-    """ Difference the query card image from each of the train images,
-        and return the result with the least difference """
-    best_match_diff = 10000
-    best_name = "Unknown"
+def template_distances(images: List[ndarray], bank: TemplateBank) -> ndarray:
+    """Difference every query image from every template in the bank at once.
+    Returns N x T matrix of differences, counted the same way as find_most_simmilar."""
 
-    for element in train_set:
+    if len(images) == 0:
+        return np.zeros((0, len(bank)), dtype=np.int64)
+    queries = np.stack(images).astype(np.int16)
+    diff_img = np.abs(queries[:, None] - bank.imgs[None].astype(np.int16))
+    return diff_img.reshape(len(images), len(bank), -1).sum(axis=2, dtype=np.int64) // 255
 
-        diff_img = cv2.absdiff(image, element.img)
-        diff = int(np.sum(diff_img) / 255)
 
-        if diff < best_match_diff:
-            best_match_diff = diff
-            best_name = element.name
-    return best_name, best_match_diff
+def best_matches(distances: ndarray, bank: TemplateBank) -> List[Tuple[str, int]]:
+    """For each row of distance matrix return name and difference of the closest template.
+    Differences not lower than 10000 are left as Unknown, like in find_most_simmilar."""
 
+    results = []
+    if distances.shape[0] == 0:
+        return results
+    best = np.argmin(distances, axis=1)
+    for i, j in enumerate(best):
+        diff = int(distances[i, j])
+        if diff < 10000:
+            results.append((bank.names[j], diff))
+        else:
+            results.append(("Unknown", 10000))
+    return results
+
+
+# number of set bits of every byte value, for NumPy older than 2.0 without bitwise_count
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint16)
+
+
+def popcount(words: ndarray) -> ndarray:
+    """Number of set bits in uint64 words, summed over last axis."""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+    return POPCOUNT[words.view(np.uint8)].sum(axis=-1, dtype=np.int64)
+
+
+def hamming_distances(images: List[ndarray], bank: TemplateBank) -> ndarray:
+    """Coarse N x T differences: number of pixels that differ between binarized query and template
+    (for binary images the same as template_distances), counted on bit-packed images."""
+
+    return popcount(pack_images(np.stack(images))[:, None] ^ bank.packed[None])
+
+
+def coarse_to_fine(images: List[ndarray], bank: TemplateBank, candidates: int = MATCH_CANDIDATES) -> \
+        Tuple[ndarray, ndarray]:
+    """N x T differences, exact (as template_distances) for `candidates` templates closest by Hamming
+    distance, and coarse for the rest. Also returns mask of exact ones."""
+
+    coarse = hamming_distances(images, bank)
+    if candidates >= len(bank):
+        return template_distances(images, bank), np.ones(coarse.shape, dtype=bool)
+
+    top = np.argpartition(coarse, candidates - 1, axis=1)[:, :candidates]
+    queries = np.stack(images).astype(np.int16)
+    diff_img = np.abs(queries[:, None] - bank.imgs[top].astype(np.int16))
+    rows = np.arange(len(images))[:, None]
+    coarse[rows, top] = diff_img.reshape(len(images), candidates, -1).sum(axis=2, dtype=np.int64) // 255
+    exact = np.zeros(coarse.shape, dtype=bool)
+    exact[rows, top] = True
+    return coarse, exact
+
+
+def score_matches(images: List[ndarray], bank: TemplateBank, diff_max: int) -> List[Tuple[str, int, float, float]]:
+    """For each image name and difference of the closest template (found coarse to fine), with
+    confidence: 1 for perfect match, falling to 0 at diff_max, and margin: how much further (in
+    diff_max units) is the closest template of another name."""
+
+    results = []
+    if len(images) == 0:
+        return results
+    distances, exact = coarse_to_fine(images, bank)
+    names = np.array(bank.names)
+    best = np.argmin(np.where(exact, distances, np.iinfo(np.int64).max), axis=1)
+    for i, j in enumerate(best):
+        diff = int(distances[i, j])
+        if diff >= 10000:
+            results.append(("Unknown", 10000, 0.0, 0.0))
+            continue
+        others = distances[i, names != names[j]]
+        runner_up = int(others.min()) if len(others) > 0 else diff + diff_max
+        confidence = min(max(1 - diff / diff_max, 0.0), 1.0)
+        margin = min(max((runner_up - diff) / diff_max, 0.0), 1.0)
+        results.append((bank.names[j], diff, confidence, margin))
+    return results
+
+
+@timed('match_cards')
+def match_cards(q_cards: List[QueryCard], rank_bank: TemplateBank, suit_bank: TemplateBank) -> \
+        List[Tuple[str, str, int, int, float, float]]:
+    """Batched version of match_card. Scores rank and suit images of all cards in the frame
+    against templates, coarse to fine. Besides names and differences returns confidence and
+    margin of the card (the lower of rank's and suit's, see score_matches)."""
+
+    results = [("Unknown", "Unknown", 10000, 10000, 0.0, 0.0) for _ in q_cards]
+    matchable = [i for i, q_card in enumerate(q_cards) if len(q_card.rank_img) != 0 and len(q_card.suit_img) != 0]
+    if len(matchable) == 0:
+        return results
+
+    ranks = score_matches([q_cards[i].rank_img for i in matchable], rank_bank, RANK_DIFF_MAX)
+    suits = score_matches([q_cards[i].suit_img for i in matchable], suit_bank, SUIT_DIFF_MAX)
+    for i, (rank_name, rank_diff, rank_conf, rank_margin), (suit_name, suit_diff, suit_conf, suit_margin) in \
+            zip(matchable, ranks, suits):
+        results[i] = (rank_name if rank_diff < RANK_DIFF_MAX else "Unknown",
+                      suit_name if suit_diff < SUIT_DIFF_MAX else "Unknown",
+                      rank_diff, suit_diff, min(rank_conf, suit_conf), min(rank_margin, suit_margin))
+    return results
 
-def find_coins(image: ndarray) -> List[List[Coin]]:
-    coins = [[], []]
-    circles = cv2.HoughCircles(image, cv2.HOUGH_GRADIENT, 1, 80, param1=32, param2=32, minRadius=50, maxRadius=70)
+
+def find_most_simmilar(image: ndarray, train_set: List[TrainRanks]) -> Tuple[str, int]:
+    """ Difference the query card image from each of the train images (coarse to fine),
+        and return the result with the least difference """
+    bank = train_set if isinstance(train_set, TemplateBank) else build_bank(train_set)
+    name, diff, confidence, margin = score_matches([image], bank, 10000)[0]
+    return name, diff
+
+
+@timed('find_coins')
+def find_coins(image: ndarray, offset: Tuple[int, int] = (0, 0),
+               zone: Tuple[int, int, int, int] = (0, 0, IM_WIDTH, IM_HEIGHT), scale: int = 1) -> List[Coin]:
+    """Finds coins in thresholded image, which starts at offset of the camera image and can be downscaled
+    scale times. Keeps only coins with center inside zone (x, y, width, height) and returns their positions
+    in full resolution camera image coordinates."""
+    coins = []
+    circles = cv2.HoughCircles(image, cv2.HOUGH_GRADIENT, 1, 80 / scale, param1=32, param2=32 / scale,
+                               minRadius=COIN_MIN_RADIUS // scale, maxRadius=COIN_MAX_RADIUS // scale)
     # ensure at least som e circles were found
     if circles is not None:
         # convert the (x, y) coordinates and radius of the circles to integers
-        circles = np.round(circles[0, :]).astype("int")
+        circles = np.round(circles[0, :] * scale).astype("int")
         # loop over the (x, y) coordinates and radius of the circles
+        zone_x, zone_y, zone_w, zone_h = zone
         for (x, y, r) in circles:
-            if y < 150:
-                if x > IM_WIDTH / 2:
-                    coins[1].append(Coin((x, y, r), 'right'))
-                else:
-                    coins[0].append(Coin((x, y, r), 'left'))
+            x, y = x + offset[0], y + offset[1]
+            if zone_x <= x < zone_x + zone_w and zone_y <= y < zone_y + zone_h:
+                coins.append(Coin((x, y, r)))
 
     return coins
 
@@ -275,6 +445,17 @@ def find_corners(pts: ndarray, w: int, h: int) -> ndarray:
     return temp_rect
 
 
+FLAT_CORNERS = np.array([[0, 0], [FLAT_WIDTH - 1, 0], [FLAT_WIDTH - 1, FLAT_HEIGHT - 1], [0, FLAT_HEIGHT - 1]],
+                        np.float32)
+
+
+def corner_transform(q_card: QueryCard) -> ndarray:
+    """Perspective transform flattening card into top-down 200x300 image. Warping with smaller
+    output size gives only top left part of it (e.g. the corner with rank and suit)."""
+    return cv2.getPerspectiveTransform(find_corners(q_card.corner_pts, q_card.width, q_card.height), FLAT_CORNERS)
+
+
+@timed('flattener')
 def flattener(image: ndarray, pts: ndarray, w: int, h: int) -> ndarray:
     """Flattens an image of a card into a top-down 200x300 perspective.
     Returns the flattened, re-sized, grayed image.
@@ -282,14 +463,9 @@ def flattener(image: ndarray, pts: ndarray, w: int, h: int) -> ndarray:
 
     corrner_points = find_corners(pts, w, h)
 
-    maxWidth = 200
-    maxHeight = 300
-
-    # Create destination array, calculate perspective transform matrix,
-    # and warp card image
-    dst = np.array([[0, 0], [maxWidth - 1, 0], [maxWidth - 1, maxHeight - 1], [0, maxHeight - 1]], np.float32)
-    M = cv2.getPerspectiveTransform(corrner_points, dst)
-    warp = cv2.warpPerspective(image, M, (maxWidth, maxHeight))
+    # Calculate perspective transform matrix, and warp card image
+    M = cv2.getPerspectiveTransform(corrner_points, FLAT_CORNERS)
+    warp = cv2.warpPerspective(image, M, (FLAT_WIDTH, FLAT_HEIGHT))
     warp = cv2.cvtColor(warp, cv2.COLOR_BGR2GRAY)
 
     return warp
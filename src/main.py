@@ -1,19 +1,42 @@
+import time
 from typing import List, Optional, Tuple
 
 import cv2
 from config import *
-from src.helpers import load_ranks, load_suits, preprocess_image, find_cards, preprocess_card, find_coins, match_card
+from src.bank import load_banks
+from src.events import open_sink
+from src.helpers import find_cards_in_regions
+from src.models.CardSet import CardSet
 from src.models.Game import Game
+from src.models.TableState import TableState
+from src.models.TemplateBank import TemplateBank
+from src.motion import MotionGate
+from src.overlay import Overlay
+from src.pipeline import run_pipeline
+from src.profiling import timed, profiler
 from src.models.Player import Player
 from numpy import ndarray
 
 from src.models.QueryCard import QueryCard
 
-FONT = cv2.FONT_HERSHEY_SIMPLEX
+LABEL_COLOR = (0, 246, 147)
+HUD_COLOR = (147, 246, 200)
+WINNERS_COLOR = (0, 255, 255)
+OUTLINE_COLOR = (0, 0, 0)
 
 
+@timed('draw_results')
 def draw_results(image: ndarray, q_card: QueryCard) -> ndarray:
-    """Draw the card name, center point, and contour on the camera image."""
+    """Draw the center point of recognised card on the camera image."""
+
+    if q_card.best_rank_match != "Unknown" or q_card.best_suit_match != "Unknown":
+        if q_card.best_suit_match != 'reverse' and q_card.best_suit_match != 'deck':
+            cv2.circle(image, (q_card.center[0], q_card.center[1]), 5, (255, 0, 0), -1)
+    return image
+
+
+def label_results(overlay: Overlay, q_card: QueryCard) -> None:
+    """Label the card with its name."""
 
     x = q_card.center[0]
     y = q_card.center[1]
@@ -22,45 +45,29 @@ def draw_results(image: ndarray, q_card: QueryCard) -> ndarray:
 
     if rank_name != "Unknown" or suit_name != "Unknown":
         if suit_name != 'reverse' and suit_name != 'deck':
-            cv2.circle(image, (x, y), 5, (255, 0, 0), -1)
-
-            cv2.putText(image, (rank_name + ' of'), (x - 60, y - 10), FONT, 1, (0, 0, 0), 4, cv2.LINE_AA)
-            cv2.putText(image, (rank_name + ' of'), (x - 60, y - 10), FONT, 1, (0, 246, 147), 2, cv2.LINE_AA)
-
-            cv2.putText(image, suit_name, (x - 60, y + 25), FONT, 1, (0, 0, 0), 4, cv2.LINE_AA)
-            cv2.putText(image, suit_name, (x - 60, y + 25), FONT, 1, (0, 246, 147), 2, cv2.LINE_AA)
+            overlay.text(rank_name + ' of', (x - 60, y - 10), 1, LABEL_COLOR, 2, OUTLINE_COLOR, 4)
+            overlay.text(suit_name, (x - 60, y + 25), 1, LABEL_COLOR, 2, OUTLINE_COLOR, 4)
         else:
-            cv2.putText(image, suit_name, (x - 60, y), FONT, 1, (0, 0, 0), 4, cv2.LINE_AA)
-            cv2.putText(image, suit_name, (x - 60, y), FONT, 1, (0, 246, 147), 2, cv2.LINE_AA)
-
-    return image
-
-
-def draw_points(image: ndarray, game: Game) -> ndarray:
-    pos = [(IM_WIDTH // 2, IM_HEIGHT // 2 + 20), (30, 60), (IM_WIDTH // 2, 60)]
-    for player, (x, y) in zip(game.players, pos):
-        cv2.putText(image, (player.name + ' points ' + str(player.points)), (x, y), FONT, 1, (147, 246, 200), 3,
-                    cv2.LINE_AA)
-        cv2.putText(image, (player.name + ' cards ' + str(player.total_cards)), (x, y + 50), FONT, 1, (147, 246, 200),
-                    3, cv2.LINE_AA)
+            overlay.text(suit_name, (x - 60, y), 1, LABEL_COLOR, 2, OUTLINE_COLOR, 4)
 
-    cv2.putText(image, ('Player1 coins ' + str(game.players[1].coins)), (30, 160), FONT, 1, (147, 246, 200), 3,
-                cv2.LINE_AA)
-    cv2.putText(image, ('Player2 coins ' + str(game.players[2].coins)), (IM_WIDTH // 2, 160), FONT, 1, (147, 246, 200),
-                3, cv2.LINE_AA)
 
-    return image
+def label_points(overlay: Overlay, game: Game) -> None:
+    for i, (player, seat) in enumerate(zip(game.players, game.layout.seats)):
+        x, y = seat['label']
+        overlay.text(player.name + ' points ' + str(player.points), (x, y), 1, HUD_COLOR, 3)
+        overlay.text(player.name + ' cards ' + str(player.total_cards), (x, y + 50), 1, HUD_COLOR, 3)
+        if i > 0:
+            overlay.text(player.name + ' coins ' + str(player.coins), (x, y + 100), 1, HUD_COLOR, 3)
 
 
-def draw_actions(image: ndarray, game: Game) -> ndarray:
-    if len(game.actions_to_print) > 0:
-        height = IM_HEIGHT // 2 + 100
-        for action in game.actions_to_print:
-            cv2.putText(image, (action), (50, height), FONT, 1, (0, 0, 0), 3, cv2.LINE_AA)
-            height += 50
-    return image
+def label_actions(overlay: Overlay, game: Game) -> None:
+    height = IM_HEIGHT // 2 + 100
+    for action in game.actions_to_print:
+        overlay.text(action, (50, height), 1, OUTLINE_COLOR, 3)
+        height += 50
 
 
+@timed('draw_coins')
 def draw_coins(image: ndarray, game: Game) -> ndarray:
     if len(game.coins) > 0:
         for player in game.coins:
@@ -70,53 +77,74 @@ def draw_coins(image: ndarray, game: Game) -> ndarray:
     return image
 
 
-def draw_winners(image: ndarray, new_winners: List[str]) -> ndarray:
+def label_winners(overlay: Overlay, new_winners: List[str]) -> None:
     if len(new_winners) > 0:
-        cv2.putText(image, 'The winners are(is):', (200, IM_HEIGHT // 2 - 100), FONT, 5, (0, 0, 0), 6, cv2.LINE_AA)
-        cv2.putText(image, 'The winners are(is):', (200, IM_HEIGHT // 2 - 100), FONT, 5, (0, 255, 255), 4, cv2.LINE_AA)
+        overlay.text('The winners are(is):', (200, IM_HEIGHT // 2 - 100), 5, WINNERS_COLOR, 4, OUTLINE_COLOR, 6)
         h = 0
         for winner in new_winners:
-            cv2.putText(image, (winner), (200, IM_HEIGHT // 2 + h), FONT, 5, (0, 0, 0), 6, cv2.LINE_AA)
-            cv2.putText(image, (winner), (200, IM_HEIGHT // 2 + h), FONT, 5, (0, 255, 255), 4, cv2.LINE_AA)
+            overlay.text(winner, (200, IM_HEIGHT // 2 + h), 5, WINNERS_COLOR, 4, OUTLINE_COLOR, 6)
             h += 100
-    return image
-
-
-def main_logic(new_frame: ndarray, search: bool, new_game: Optional[Game], new_winners: dict, debug=False) -> \
-        Tuple[ndarray, List, bool, dict]:
-    global game
-    if new_game:  # at the begging, or when is nessesery, create  new game
-        players = [Player('Dealer'), Player('Player1'), Player('Player2')]
-        game = Game(players)
-        new_game = False
-
-    if search:  # only every 15 frame do this part
-        cards = []
-        pre_proc = preprocess_image(new_frame)
-        card_cnts = find_cards(pre_proc)
-
-        if len(card_cnts) != 0:
-            for i in range(len(card_cnts)):
-                cards.append(preprocess_card(card_cnts[i], new_frame, debug))
-                cards[i].best_rank_match, cards[i].best_suit_match, cards[i].rank_diff, cards[i].suit_diff = match_card(
-                    cards[i], train_ranks, train_suits)
-
-        game.coins = find_coins(pre_proc)
-        game.cards = cards
-
-        game.search_deck()  # find deck and reverse
-        game.clean_cards()  # deleate all non card from cards
-        game.restore_cards()  # restore cards from prev iter
-        game.restore_coins()  # restore coins from prev iter
-        game.add_deck()  # add deck and reverse
-
-        game.count_cards()
-        game.search_action()  # search for basic actions
 
-        game.set_prev()  # set current state of the game as previosuly for next iter
 
-        game.set_coins()  # cet number of coins and points for print
-        game.set_points()
+def main_logic(new_frame: ndarray, search: bool, table: TableState, debug=False) -> Tuple[ndarray, List]:
+    next_frame(table)
+    if search:  # only on frames chosen by MotionGate do this part
+        search_table(new_frame, table)
+    new_frame = draw_table(new_frame, table)
+    if search:
+        update_winners(table)
+    return new_frame, table.game.cards
+
+
+def next_frame(table: TableState, frame_number: Optional[int] = None) -> Game:
+    """Counts the frame (or jumps to given frame number, when frames in between were dropped),
+    and at the begging, or when is nessesery, creates new game."""
+    table.frames = table.frames + 1 if frame_number is None else frame_number
+    if table.new_game:
+        players = [Player(name) for name in table.layout.seat_names]
+        table.game = Game(players, table.sink, table.fps, table.layout)
+        table.new_game = False
+    return table.game
+
+
+def search_table(new_frame: ndarray, table: TableState) -> None:
+    """Finds cards and coins on the frame and updates game state, without drawing anything."""
+    game = table.game
+    game.set_frame(table.frames)
+    height, width = new_frame.shape[:2]
+    # threshold and search only zones of the table, where game happens
+    cards = find_cards_in_regions(new_frame, table.layout.card_regions(width, height), PYRAMID_SCALE)
+    # only new, moved or uncertain cards are warped and matched again
+    cards = table.tracker.update(cards, new_frame, table.frames, table.rank_bank, table.suit_bank)
+
+    # betting strips are searched for coins only when they change
+    game.coins = table.coin_tracker.update(new_frame, table.layout, PYRAMID_SCALE, game.prev_coins)
+    game.cards = CardSet(cards, table.layout)
+
+    game.search_deck()  # find deck and reverse
+    game.clean_cards()  # deleate all non card from cards
+    game.restore_cards()  # restore cards from prev iter
+    game.restore_coins()  # restore coins from prev iter
+    game.add_deck()  # add deck and reverse
+
+    game.count_cards()
+    game.search_action()  # search for basic actions
+
+    game.set_prev()  # set current state of the game as previosuly for next iter
+
+    game.set_coins()  # cet number of coins and points for print
+    game.set_points()
+
+
+def draw_table(new_frame: ndarray, table: TableState) -> ndarray:
+    """Draws cards, coins, actions, points and winners of current game on the frame.
+    Labels are made again only when game state has changed since previous frame."""
+    game = table.game
+    overlay = table.overlay
+    winners = tuple(table.winners['who']) if table.winners['time'] > 0 else ()
+    key = (id(game), game.frame, winners)
+    if overlay.key != key:
+        label_table(table, key)
 
     if len(game.cards) != 0:
         for card in game.cards:
@@ -127,58 +155,112 @@ def main_logic(new_frame: ndarray, search: bool, new_game: Optional[Game], new_w
         cv2.drawContours(new_frame, temp_cnts, -1, (255, 0, 0), 2)
 
         new_frame = draw_coins(new_frame, game)
-        new_frame = draw_actions(new_frame, game)
-        new_frame = draw_points(new_frame, game)
-        if new_winners['time'] > 0:
-            new_frame = draw_winners(new_frame, new_winners['who'])
+    return overlay.draw(new_frame)
 
-    if search:
-        new_game = game.new_game()
-        if len(new_winners['who']) == 0:
-            if game.has_game_concluded() and new_game is False:
-                new_winners['who'] = game.who_win()
-                new_winners['time'] = 12
+
+@timed('label_table')
+def label_table(table: TableState, key) -> None:
+    game = table.game
+    overlay = table.overlay
+    overlay.clear(key)
+    if len(game.cards) != 0:
+        for card in game.cards:
+            label_results(overlay, card)
+        label_actions(overlay, game)
+        label_points(overlay, game)
+        if table.winners['time'] > 0:
+            label_winners(overlay, table.winners['who'])
+
+
+def update_winners(table: TableState) -> None:
+    """After search, checks if new game has started or hand has concluded, and counts down
+    how long winners are shown."""
+    game = table.game
+    new_winners = table.winners
+    table.new_game = game.new_game()
+    if table.new_game:
+        game.emit('new_game')
+    if len(new_winners['who']) == 0:
+        if game.has_game_concluded() and table.new_game is False:
+            new_winners['who'] = game.who_win()
+            new_winners['time'] = WINNERS_FRAMES
+            table.hands.append(new_winners['who'])
+            table.hand_count += 1
+            for player in game.players:
+                if player.name in new_winners['who']:
+                    game.emit('win', player)
+    else:
+        if new_winners['time'] > 0:
+            new_winners['time'] = max(0, new_winners['time'] - game.elapsed)
         else:
-            if new_winners['time'] > 0:
-                new_winners['time'] -= 1
-            else:
-                new_winners['who'] = []
+            new_winners['who'] = []
 
-    return new_frame, game.cards, new_game, new_winners
 
+def process_video(input_path: str, output_path: Optional[str], rank_bank: TemplateBank, suit_bank: TemplateBank,
+                  events_path: Optional[str] = None) -> dict:
+    """Runs detection over whole video with its own game state, and writes video with results
+    to output_path (if given) and game events to events_path (if given, see open_sink).
+    Returns summary with wall time, fps and detected hands."""
 
-if __name__ == "__main__":
-    train_ranks = load_ranks('Card_Imgs/')
-    train_suits = load_suits('Card_Imgs/')
-    cap = cv2.VideoCapture('video/idk3.mp4')
-    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    if total == 0:
-        print('Video was not found')
-    else:
-    # print(total)
-        fourcc = cv2.VideoWriter_fourcc(*'MP4V')
-        out = cv2.VideoWriter('output/idk3.mp4', fourcc, 30.0, (1920, 1080))
-
-        frames_count = 0
-        last_frame = None
-        new_game = True
-        game = None
-        winners = {'who': [], 'time': 0}
-        print('Program is running...')
-        while cap.isOpened():
-            ret, frame = cap.read()
-            frames_count += 1
-            # if frame is read correctly ret is True
-            if not ret:
-                print("Can't receive frame (stream end?). \nExiting ...")
-                break
-            last_frame = frame
-            if frames_count % 15 == 0:  # search for cards only on every 15's frame
-                frame, cards, new_game, winners = main_logic(frame, True, new_game, winners)
-            else:
-                frame, cards, new_game, winners = main_logic(frame, False, new_game, winners)
-            out.write(frame)
-            if cv2.waitKey(1) == ord('q'):
-                break
+    start = time.perf_counter()
+    cap = cv2.VideoCapture(input_path)
+    if not cap.isOpened() or int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) <= 0:
+        cap.release()
+        return {'file': input_path, 'error': 'Video was not found'}
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    out = NullWriter()
+    if output_path is not None:
+        size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'MP4V'), fps, size)
+
+    sink = open_sink(events_path) if events_path is not None else None
+    table = TableState(rank_bank, suit_bank, sink=sink, fps=fps)
+    gate = MotionGate()
+
+    def process_frame(frame: ndarray, frames_count: int) -> ndarray:
+        # search for cards only when table changes, or from time to time
+        with profiler.frame(frames_count):
+            frame, cards = main_logic(frame, gate.should_search(frame), table)
+        return frame
+
+    # reading, detection and writing run in separate stages, so decoding and encoding overlap detection
+    try:
+        stages = run_pipeline(cap, out, process_frame)
+    finally:
         cap.release()
         out.release()
+        if sink is not None:
+            sink.close()
+
+    wall = time.perf_counter() - start
+    frames = stages[1].frames
+    return {'file': input_path, 'frames': frames, 'wall_time': wall, 'fps': frames / wall if wall > 0 else 0.0,
+            'hands': list(table.hands), 'hand_count': table.hand_count,
+            'stages': {stage.name: {'frames': stage.frames, 'busy': stage.busy} for stage in stages}}
+
+
+class NullWriter:
+    """Stands in for cv2.VideoWriter when output video is not needed."""
+
+    def write(self, frame: ndarray) -> None:
+        pass
+
+    def release(self) -> None:
+        pass
+
+
+if __name__ == "__main__":
+    rank_bank, suit_bank = load_banks('Card_Imgs/')
+    profiler.capture_on(PROFILE_FRAMES)
+    print('Program is running...')
+    summary = process_video('video/idk3.mp4', 'output/idk3.mp4', rank_bank, suit_bank)
+    if profiler.enabled:
+        profiler.write_report(PROFILE_REPORT)
+        profiler.dump_capture(PROFILE_CAPTURE)
+    if 'error' in summary:
+        print(summary['error'])
+    else:
+        for name, stage in summary['stages'].items():
+            print(name + ': ' + str(stage['frames']) + ' frames, ' + str(round(stage['busy'], 2)) + ' s busy')
+        print("Stream end. \nExiting ...")
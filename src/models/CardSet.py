@@ -0,0 +1,94 @@
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from src.config import *
+from src.models.QueryCard import QueryCard
+from src.models.TableLayout import TableLayout, NO_ZONE
+
+# Names behind small int ids kept in arrays
+RANK_NAMES = list(dict.fromkeys(RANK_FILES.values())) + ['Unknown']
+SUIT_NAMES = list(dict.fromkeys(SUIT_FILES.values())) + ['Unknown', 'deck', 'reverse']
+RANK_IDS = {name: i for i, name in enumerate(RANK_NAMES)}
+SUIT_IDS = {name: i for i, name in enumerate(SUIT_NAMES)}
+UNKNOWN_RANK = RANK_IDS['Unknown']
+UNKNOWN_SUIT = SUIT_IDS['Unknown']
+
+ARRAYS = ('centers', 'sizes', 'rank_ids', 'suit_ids', 'rank_diffs', 'suit_diffs', 'zones', 'track_ids')
+
+
+class CardSet:
+    """Cards of one search as structure of arrays: centers, sizes, rank and suit ids, diffs, zones
+    (labels of layout, see TableLayout.zone_of) and track ids, for vectorized queries. QueryCards stay
+    as views for drawing and images, the set keeps their names and its arrays in sync (use set_rank
+    and set_suit to change them)."""
+
+    def __init__(self, cards: Iterable[QueryCard] = (), layout: Optional[TableLayout] = None):
+        self.cards = list(cards)
+        self.layout = layout
+        n = len(self.cards)
+        self.centers = np.array([card.center for card in self.cards], dtype=np.int32).reshape(n, 2)
+        self.sizes = np.array([card.size for card in self.cards], dtype=np.float64)
+        self.rank_ids = np.array([RANK_IDS.get(card.best_rank_match, UNKNOWN_RANK) for card in self.cards],
+                                 dtype=np.int8)
+        self.suit_ids = np.array([SUIT_IDS.get(card.best_suit_match, UNKNOWN_SUIT) for card in self.cards],
+                                 dtype=np.int8)
+        self.rank_diffs = np.array([card.rank_diff for card in self.cards], dtype=np.int32)
+        self.suit_diffs = np.array([card.suit_diff for card in self.cards], dtype=np.int32)
+        self.zones = layout.zone_of(self.centers) if layout is not None else np.full(n, NO_ZONE, dtype=np.uint8)
+        self.track_ids = np.array([-1 if card.track_id is None else card.track_id for card in self.cards],
+                                  dtype=np.int32)
+
+    def __len__(self):
+        return len(self.cards)
+
+    def __iter__(self):
+        return iter(self.cards)
+
+    def __getitem__(self, i: int) -> QueryCard:
+        return self.cards[i]
+
+    def append(self, card: QueryCard) -> None:
+        other = CardSet([card], self.layout)
+        self.cards.append(card)
+        for name in ARRAYS:
+            setattr(self, name, np.concatenate([getattr(self, name), getattr(other, name)]))
+
+    def select(self, mask: np.ndarray) -> 'CardSet':
+        """Cards where mask is True, in the same order."""
+        subset = CardSet.__new__(CardSet)
+        subset.cards = [card for card, keep in zip(self.cards, mask) if keep]
+        subset.layout = self.layout
+        for name in ARRAYS:
+            setattr(subset, name, getattr(self, name)[mask])
+        return subset
+
+    def copies(self, i: int) -> List[int]:
+        """Indices of card i, the same card can be in the set more than once (e.g. deck)."""
+        return [j for j, card in enumerate(self.cards) if card is self.cards[i]]
+
+    def set_rank(self, i: int, name: str) -> None:
+        self.cards[i].best_rank_match = name
+        self.rank_ids[self.copies(i)] = RANK_IDS.get(name, UNKNOWN_RANK)
+
+    def set_suit(self, i: int, name: str) -> None:
+        self.cards[i].best_suit_match = name
+        self.suit_ids[self.copies(i)] = SUIT_IDS.get(name, UNKNOWN_SUIT)
+
+    def known(self) -> np.ndarray:
+        """Cards with rank or suit recognised."""
+        return (self.rank_ids != UNKNOWN_RANK) | (self.suit_ids != UNKNOWN_SUIT)
+
+    def distances(self, point) -> np.ndarray:
+        """Distances of card centers to point."""
+        dx = self.centers[:, 0] - float(point[0])
+        dy = self.centers[:, 1] - float(point[1])
+        return np.sqrt(dx * dx + dy * dy)
+
+    def nearest(self, point) -> Tuple[float, int]:
+        """Distance to the closest card and its index (10000 and -1 when set is empty)."""
+        if len(self.cards) == 0:
+            return 10000, -1
+        distances = self.distances(point)
+        i = int(np.argmin(distances))
+        return float(distances[i]), i
@@ -1,4 +1,13 @@
 class Coin:
-    def __init__(self, pos, side):
-        self.pos = pos
-        self.side = side
+    __slots__ = ('pos', 'coin_id')
+
+    def __init__(self, pos, coin_id=None):
+        self.pos = pos  # (x, y, radius) in camera image
+        self.coin_id = coin_id  # Id kept while coin is followed between searches
+
+    def to_dict(self) -> dict:
+        return {'pos': [int(v) for v in self.pos], 'coin_id': self.coin_id}
+
+    @staticmethod
+    def from_dict(data: dict) -> 'Coin':
+        return Coin(tuple(data['pos']), data['coin_id'])
@@ -1,50 +1,42 @@
-import math
-from typing import Tuple, List
+from collections import deque
+from typing import List, Optional
+
+import numpy as np
 
 from src.config import *
+from src.models.CardSet import CardSet, RANK_IDS, SUIT_IDS, UNKNOWN_RANK, UNKNOWN_SUIT
+from src.models.Coin import Coin
+from src.models.GameEvent import GameEvent
+from src.models.Player import Player
+from src.models.TableLayout import TableLayout, default_layout, SHOE, HOLE
 from src.models.QueryCard import QueryCard
+from src.profiling import timed
+from src.scoring import score_hands, hand_seats
+from src.spatial import restore_nearest
+
 
+DECK = SUIT_IDS['deck']
+REVERSE = SUIT_IDS['reverse']
 
-def count_points(cards, half, side):
-    total = 0
-    for card in cards:
-        if card.half == half and card.side in side:
-            if card.best_rank_match == 'Two':
-                total += 2
-            elif card.best_rank_match == 'Three':
-                total += 3
-            elif card.best_rank_match == 'Four':
-                total += 4
-            elif card.best_rank_match == 'Five':
-                total += 5
-            elif card.best_rank_match == 'Six':
-                total += 6
-            elif card.best_rank_match == 'Seven':
-                total += 7
-            elif card.best_rank_match == 'Eight':
-                total += 8
-            elif card.best_rank_match == 'Nine':
-                total += 9
-            elif (card.best_rank_match == 'Jack' or card.best_rank_match == 'Queen'
-                  or card.best_rank_match == 'King' or card.best_rank_match == 'Ten'):
-                total += 10
-            elif card.best_rank_match == 'Ace':
-                if total + 11 > 21:
-                    total += 1
-                else:
-                    total += 11
-    return total
+# attributes of Game kept in its state as they are
+STATE_FIELDS = ('frame', 'elapsed', 'zeros_since', 'was_reverse_puted', 'was_reverse_inverted', 'temp', 'game_ended',
+                'end_of_dealing')
 
 
 class Game:
-    def __init__(self, players):
-        self.players = players  # [dealer, player1, player2]
-        self.cards = []
-        self.coins = [[], []]
-        self.prev_cards = []
-        self.prev_coins = [[], []]
-        self.was_all_zeros = []
-        self.actions = [[] for i in range(10)]  # x= 5 is for how long (x*15 frames)
+    def __init__(self, players, sink=None, fps: float = 30.0, layout: TableLayout = None):
+        self.players = players  # [dealer, player1, player2, ...], one for every seat of layout
+        self.layout = default_layout() if layout is None else layout  # seats, shoe and hole of the table
+        self.sink = sink  # EventSink receiving GameEvents, optional
+        self.fps = fps  # to give events time in video
+        self.cards = CardSet()
+        self.coins = [[] for player in players[1:]]  # coins in betting strip of every player
+        self.prev_cards = CardSet()
+        self.prev_coins = [[] for player in players[1:]]
+        self.frame = None  # frame number of current search, durations are counted in frames
+        self.elapsed = SEARCH_INTERVAL  # frames since previous search
+        self.zeros_since = None  # frame from which noone has any points
+        self.actions = deque(maxlen=ACTION_HISTORY)  # (action, frame from which it is not shown)
         self.actions_to_print = []
         self.deck = None
         self.reverse = None
@@ -56,101 +48,167 @@ class Game:
         self.game_ended = False
         self.end_of_dealing = False
 
+    def state(self) -> dict:
+        """Everything game keeps between searches as plain data, without card images. Card or coin which
+        is in more lists (e.g. cards and prev_cards) is stored once and referred to by index."""
+        cards, coins = [], []
+        card_index, coin_index = {}, {}
+
+        def refer(items, objects, index):
+            refs = []
+            for item in items:
+                if id(item) not in index:
+                    index[id(item)] = len(objects)
+                    objects.append(item)
+                refs.append(index[id(item)])
+            return refs
+
+        state = {name: getattr(self, name) for name in STATE_FIELDS}
+        state['players'] = [player.to_dict() for player in self.players]
+        state['cards'] = refer(self.cards, cards, card_index)
+        state['prev_cards'] = refer(self.prev_cards, cards, card_index)
+        state['deck'] = refer([self.deck], cards, card_index)[0] if self.deck is not None else None
+        state['reverse'] = refer([self.reverse], cards, card_index)[0] if self.reverse is not None else None
+        state['coins'] = [refer(strip, coins, coin_index) for strip in self.coins]
+        state['prev_coins'] = [refer(strip, coins, coin_index) for strip in self.prev_coins]
+        state['actions'] = [list(action) for action in self.actions]
+        state['actions_to_print'] = list(self.actions_to_print)
+        state['card_list'] = [card.to_dict() for card in cards]
+        state['coin_list'] = [coin.to_dict() for coin in coins]
+        return state
+
+    @staticmethod
+    def from_state(state: dict, sink=None, fps: float = 30.0, layout: TableLayout = None) -> 'Game':
+        """Game in state given by state(), cards have no images."""
+        game = Game([Player.from_dict(data) for data in state['players']], sink, fps, layout)
+        for name in STATE_FIELDS:
+            setattr(game, name, state[name])
+        cards = [QueryCard.from_dict(data) for data in state['card_list']]
+        coins = [Coin.from_dict(data) for data in state['coin_list']]
+        game.cards = CardSet([cards[i] for i in state['cards']], game.layout)
+        game.prev_cards = game.cards if state['prev_cards'] == state['cards'] else \
+            CardSet([cards[i] for i in state['prev_cards']], game.layout)
+        game.deck = cards[state['deck']] if state['deck'] is not None else None
+        game.reverse = cards[state['reverse']] if state['reverse'] is not None else None
+        game.coins = [[coins[i] for i in strip] for strip in state['coins']]
+        game.prev_coins = game.coins if state['prev_coins'] == state['coins'] else \
+            [[coins[i] for i in strip] for strip in state['prev_coins']]
+        game.actions.extend(tuple(action) for action in state['actions'])
+        game.actions_to_print = list(state['actions_to_print'])
+        return game
+
+    def set_frame(self, frame: int) -> None:
+        """Start new search on given frame. Searches do not have to be evenly spaced, so everything
+        is counted in frames."""
+        if self.frame is not None:
+            self.elapsed = frame - self.frame
+        self.frame = frame
+
+    def player_cards(self, player) -> List[QueryCard]:
+        seat = hand_seats(self.cards, len(self.players)) == self.players.index(player)
+        mask = seat & ~np.isin(self.cards.suit_ids, [DECK, REVERSE])
+        return self.cards.select(mask).cards
+
+    def emit(self, kind: str, player=None, chips: Optional[int] = None) -> GameEvent:
+        """Creates event of current search and passes it to sink. Event of a player carries
+        his current cards and points."""
+        cards, points = [], None
+        if player is not None:
+            cards = [(card.best_rank_match, card.best_suit_match) for card in self.player_cards(player)]
+            points = int(score_hands(self.cards, len(self.players))[0][self.players.index(player)])
+        frame = self.frame if self.frame is not None else 1
+        event = GameEvent(kind, frame, (frame - 1) / self.fps, None if player is None else player.name,
+                          cards, points, chips)  # frames are counted from 1
+        if self.sink is not None:
+            self.sink.write(event)
+        return event
+
+    def add_action(self, kind: str, player=None, frames: int = ACTION_FRAMES) -> None:
+        """Emit event and show it as action for given number of frames"""
+        event = self.emit(kind, player)
+        self.actions.append((event.text, event.frame + frames))  # oldest is dropped when history is full
+
+    @timed('game.set_points')
     def set_points(self) -> None:
         """ Set new number of points in game for each player, only if this number is greater than prev score"""
-        dealer_p = count_points(self.cards, 'bottom', ['left', 'right'])
-        p1_p = count_points(self.cards, 'top', ['left'])
-        p2_p = count_points(self.cards, 'top', ['right'])
+        points, soft = score_hands(self.cards, len(self.players))
 
-        if dealer_p == 0 and p1_p == 0 and p2_p == 0:
-            self.was_all_zeros.append(True)
+        if not points.any():
+            if self.zeros_since is None:
+                self.zeros_since = self.frame
         else:
-            self.was_all_zeros.append(False)
+            self.zeros_since = None
 
-        self.players[0].points = dealer_p
-        self.players[1].points = p1_p
-        self.players[2].points = p2_p
+        for player, player_points, player_soft in zip(self.players, points.tolist(), soft.tolist()):
+            player.points = player_points
+            player.soft = player_soft
 
+    @timed('game.set_coins')
     def set_coins(self) -> None:
-        player1_coins = len(self.coins[0])
-        player2_coins = len(self.coins[1])
-        if self.players[1].coins < player1_coins:
-            self.players[1].coins = player1_coins
-        if self.players[2].coins < player2_coins:
-            self.players[2].coins = player2_coins
-
+        for player, coins in zip(self.players[1:], self.coins):
+            if player.coins < len(coins):
+                player.coins = len(coins)
+
+        # bet changes when chip comes or goes, even if their number stays the same
+        for player, coins in zip(self.players[1:], self.coins):
+            bet = tuple(sorted(coin.coin_id for coin in coins if coin.coin_id is not None))
+            if bet != player.bet:
+                player.bet = bet
+                self.emit('bet', player, len(coins))
+
+    @timed('game.clean_cards')
     def clean_cards(self) -> None:
         """ Remove all cards thats have unknown rank and suit and add deck and reverse"""
-        too_remove = []
-        for card in self.cards:
-            if card.best_rank_match == "Unknown" and (
-                    card.best_suit_match == "Unknown" or card.best_suit_match == 'reverse'):
-                too_remove.append(card)
-        self.cards = [card for card in self.cards if card not in too_remove]
+        cards = self.cards
+        unknown = (cards.rank_ids == UNKNOWN_RANK) & np.isin(cards.suit_ids, [UNKNOWN_SUIT, REVERSE])
+        self.cards = cards.select(~unknown)
 
+    @timed('game.add_deck')
     def add_deck(self) -> None:
         if self.deck is not None:
             self.cards.append(self.deck)
         if self.reverse is not None:
-            dist, clost_card = self.shortest_distance(self.reverse, self.cards)
+            dist, closest = self.cards.nearest(self.reverse.center)
             if dist > 20:
                 self.cards.append(self.reverse)
             else:
                 self.reverse = None
 
-    @staticmethod
-    def shortest_distance(card: QueryCard, cards: List[QueryCard]) -> Tuple[int, QueryCard]:
-        min_d = 10000
-        closeted = None
-        for card_x in cards:
-            dist = math.sqrt((card_x.center[0] - card.center[0]) ** 2 + (card_x.center[1] - card.center[1]) ** 2)
-            if dist < min_d:
-                min_d = dist
-                closeted = card_x
-        return min_d, closeted
-
+    @timed('game.restore_cards')
     def restore_cards(self) -> None:
         """if some card was found prevoisly, but is not found currently, restore it"""
-        curr_set = []
-
-        if len(self.cards) > 0:  # do it only when find any card
-            for card in self.cards:
-                curr_set.append((card.best_rank_match, card.best_suit_match))
-            if len(self.cards) > 1:
-                for card in self.prev_cards:
-                    if (card.best_rank_match, card.best_suit_match) not in curr_set:
-                        if card.best_suit_match != 'reverse':
-                            dist, clost_card = self.shortest_distance(card, self.cards)
-                            if dist > 10:
-                                self.cards.append(card)
-                            else:
-                                if dist < 2:
-                                    # in worst case scen. 'Unknown' will change into 'Unknown'
-                                    if clost_card.best_rank_match == 'Unknown' and clost_card.best_suit_match != 'deck':
-                                        clost_card.best_rank_match = card.best_rank_match
-
-                                    if clost_card.best_suit_match == 'Unknown':
-                                        clost_card.best_suit_match = card.best_suit_match
-
+        cards = self.cards
+        if len(cards) > 1:  # do it only when find more cards
+            curr_set = set(zip(cards.rank_ids.tolist(), cards.suit_ids.tolist()))
+            prev = self.prev_cards.cards
+            missing = np.array([card.best_suit_match != 'reverse' and
+                                (RANK_IDS.get(card.best_rank_match, UNKNOWN_RANK),
+                                 SUIT_IDS.get(card.best_suit_match, UNKNOWN_SUIT)) not in curr_set
+                                for card in prev], dtype=bool)
+            # cards restored before are searched too
+            dists, closest = restore_nearest([card.center for card in prev], cards.centers, missing, 10,
+                                             RESTORE_ONE_TO_ONE)
+            for j in np.flatnonzero(missing):
+                card, i = prev[j], closest[j]
+                if i < 0:
+                    cards.append(card)
+                elif dists[j] < 2:
+                    # in worst case scen. 'Unknown' will change into 'Unknown'
+                    if cards.rank_ids[i] == UNKNOWN_RANK and cards.suit_ids[i] != DECK:
+                        cards.set_rank(i, card.best_rank_match)
+                    if cards.suit_ids[i] == UNKNOWN_SUIT:
+                        cards.set_suit(i, card.best_suit_match)
+
+    @timed('game.restore_coins')
     def restore_coins(self):
         """restore coins that are not found, but was found early"""
-        for i in range(2):
-            for coin in self.prev_coins[i]:
-                dist, clost_coin = self.shortest_distance_coins(coin, self.coins[i])
-                if dist > 50:
-                    self.coins[i].append(coin)
-
-    @staticmethod
-    def shortest_distance_coins(coin, coins):
-        min_d = 10000
-        closted = None
-        for coinx in coins:
-            dist = math.sqrt((coinx.pos[0] - coin.pos[0]) ** 2 + (coinx.pos[1] - coin.pos[1]) ** 2)
-            if dist < min_d:
-                min_d = dist
-                closted = coinx
-        return min_d, closted
+        for i in range(len(self.coins)):
+            prev, coins = self.prev_coins[i], self.coins[i]
+            dists, closest = restore_nearest([coin.pos[:2] for coin in prev], [coin.pos[:2] for coin in coins],
+                                             np.ones(len(prev), dtype=bool), 50, RESTORE_ONE_TO_ONE)
+            coins.extend(prev[j] for j in np.flatnonzero(closest < 0))
 
+    @timed('game.set_prev')
     def set_prev(self) -> None:
         """at the end, set current state of the game as previous"""
 
@@ -160,102 +218,89 @@ class Game:
         self.prev_cards = self.cards
         self.prev_coins = self.coins
 
+    @timed('game.search_action')
     def search_action(self) -> None:
         for player in self.players:
             if player.prev_total_cards != player.total_cards and player.total_cards != 0 and (
                     self.was_reverse_inverted is False or self.temp is True):
-                self.actions = [x + ['dealer deals ' + str(player.name)] for x in self.actions[:5]]
+                self.add_action('deal', player)
             if self.was_reverse_inverted is True:
                 self.temp = True
 
             if player.points > 21 and player.busted is False:
                 player.busted = True
-                self.actions = [x + [str(player.name) + ' busted'] for x in self.actions[:5]]
+                self.add_action('bust', player)
 
-            if player.points == 21 and player.total_cards == 2:
-                self.actions = [x + [str(player.name) + ' hit BLACKJACK'] for x in self.actions]
+            if player.points == 21 and player.total_cards == 2 and player.blackjack is False:
+                player.blackjack = True
+                self.add_action('blackjack', player, LONG_ACTION_FRAMES)
 
         if self.players[0].points > 17:
             self.game_ended = True
 
-        if self.players[1].coins > 1 and self.players[
-            1].raised is False and self.was_reverse_inverted is False and self.was_reverse_puted is True:
-            self.players[1].raised = True
-            self.actions = [x + [str(self.players[1].name) + ' double his bet'] for x in self.actions[:5]]
-
-        if self.players[2].coins > 1 and self.players[
-            2].raised is False and self.was_reverse_inverted is False and self.was_reverse_puted is True:
-            self.players[2].raised = True
-            self.actions = [x + [str(self.players[2].name) + ' double his bet'] for x in self.actions[:5]]
+        for player in self.players[1:]:
+            if player.coins > 1 and player.raised is False and self.was_reverse_inverted is False and \
+                    self.was_reverse_puted is True:
+                player.raised = True
+                self.add_action('double', player)
 
-        self.actions_to_print = self.actions.pop(0)
-        self.actions.append([])
+        self.actions_to_print = [action for action, until in self.actions if until > self.frame]
 
+    @staticmethod
+    def growing(sizes: np.ndarray) -> np.ndarray:
+        """Positions where size is greater than all before it (and than 0)."""
+        if len(sizes) == 0:
+            return np.zeros(0, dtype=np.intp)
+        before = np.maximum.accumulate(np.concatenate([[0], sizes[:-1]]))
+        return np.flatnonzero(sizes > before)
+
+    @timed('game.search_deck')
     def search_deck(self) -> None:
-        deck = []
-        reverse = []
-        for card in self.cards:
-            if card.side == 'left' and card.half == 'bottom':
-                if card.center[0] < IM_WIDTH / 4:
-                    deck.append(card)
-                else:
-                    reverse.append(card)
-        if len(deck) > 0:
-            max_size = 0
-            display_deck = None
-            for card in deck:
-                if card.size > max_size:
-                    max_size = card.size
-                    display_deck = card
-                    display_deck.best_suit_match = 'deck'
-            self.deck = display_deck
-        else:
-            self.deck = None
+        cards = self.cards
+        deck = np.flatnonzero(cards.zones == SHOE)
+        reverse = np.flatnonzero(cards.zones == HOLE)
+
+        # every card bigger than those before it is marked, the biggest one is the deck
+        self.deck = None
+        for i in deck[self.growing(cards.sizes[deck])]:
+            cards.set_suit(i, 'deck')
+            self.deck = cards[i]
 
         if len(reverse) > 0:
-            max_size = 0
+            # reverse is looked for only among cards before first recognised one
+            known = np.flatnonzero(cards.known()[reverse])
+            if len(known) > 0:
+                reverse = reverse[:known[0]]
             display_rewers = None
-            for card in reverse:
-                if card.best_suit_match != 'Unknown' or card.best_rank_match != 'Unknown':
-                    self.reverse = None
-                    break
-                if card.size > max_size:
-                    max_size = card.size
-                    display_rewers = card
-                    display_rewers.best_suit_match = 'reverse'
+            for i in reverse[self.growing(cards.sizes[reverse])]:
+                cards.set_suit(i, 'reverse')
+                display_rewers = cards[i]
 
             if display_rewers is not None and self.was_reverse_puted is False:
                 self.was_reverse_puted = True
             if display_rewers is None and self.was_reverse_puted is True and self.was_reverse_inverted is False:
                 self.was_reverse_inverted = True
-                self.actions = [x + ['secret card inverted'] for x in self.actions]
+                self.add_action('secret_card', frames=LONG_ACTION_FRAMES)
             self.reverse = display_rewers
         else:
             self.reverse = None
 
+    @timed('game.count_cards')
     def count_cards(self) -> None:
-        dealer = []
-        player1 = []
-        player2 = []
-        for card in self.cards:
-            if card.side == 'left' and card.half == 'top':
-                player1.append(card)
-            if card.side == 'right' and card.half == 'top':
-                player2.append(card)
-            else:
-                if card.side == 'right' and card.half == 'bottom':
-                    dealer.append(card)
-
-        self.players[0].total_cards = len(dealer) + self.was_reverse_puted
-        self.players[1].total_cards = len(player1)
-        self.players[2].total_cards = len(player2)
+        # cards in shoe and hole are not counted, dealer's hole card counts from the moment it was put down
+        zones = self.cards.zones
+        counts = np.bincount(zones[zones < len(self.players)], minlength=len(self.players))
+        for player, count in zip(self.players, counts.tolist()):
+            player.total_cards = count
+        self.players[0].total_cards += self.was_reverse_puted
 
         if self.players[0].total_cards == 2:
             self.end_of_dealing = True
 
+    @timed('game.new_game')
     def new_game(self) -> bool:
-        aa = sum([1 for x in self.was_all_zeros[-10:] if x is True])
-        if aa == 10:  # if during  10 checks(150 frames) noone have any points, its mean it is new game
+        # if during 10 checks (150 frames) noone have any points, its mean it is new game
+        if self.zeros_since is not None and self.frame - self.zeros_since >= NEW_GAME_FRAMES:
             return True
         return False
 
@@ -271,12 +316,12 @@ class Game:
             return 'dealer'
 
     def who_win(self) -> List[str]:
-        dealer, player1, player2 = self.players
+        dealer = self.players[0]
         winners = []
-        for player in [player1, player2]:
+        for player in self.players[1:]:
             if self.player_vs_dealer(player, dealer) == 'player':
                 winners.append(player)
-        if len(winners) < 2:
+        if len(winners) < len(self.players) - 1:
             winners.append(dealer)
         return [player.name for player in winners]
 
@@ -0,0 +1,37 @@
+from typing import List, Optional, Tuple
+
+# kind of event -> text shown on the frame, {} is replaced with player name
+EVENT_TEXTS = {'deal': 'dealer deals {}', 'bust': '{} busted', 'blackjack': '{} hit BLACKJACK',
+               'double': '{} double his bet', 'secret_card': 'secret card inverted', 'win': '{} wins',
+               'new_game': 'new game', 'bet': '{} changes bet'}
+
+
+class GameEvent:
+    """Structure to store one thing that happened in the game, with state of player it concerns."""
+
+    __slots__ = ('kind', 'frame', 'time', 'player', 'cards', 'points', 'chips')
+
+    def __init__(self, kind: str, frame: int, time: float, player: Optional[str] = None,
+                 cards: List[Tuple[str, str]] = (), points: Optional[int] = None, chips: Optional[int] = None):
+        self.kind = kind  # One of EVENT_TEXTS keys
+        self.frame = frame  # Frame of search in which event was found, counted from 1
+        self.time = time  # Seconds from start of the video
+        self.player = player  # Name of player, None for events of whole table
+        self.cards = list(cards)  # (rank, suit) of player's cards
+        self.points = points  # Player's points
+        self.chips = chips  # Chips in player's betting strip, for bet events
+
+    @property
+    def text(self) -> str:
+        return EVENT_TEXTS[self.kind].format(self.player)
+
+    def to_dict(self) -> dict:
+        return {'kind': self.kind, 'frame': self.frame, 'time': round(self.time, 3), 'player': self.player,
+                'cards': [list(card) for card in self.cards], 'points': self.points, 'chips': self.chips,
+                'text': self.text}
+
+    @staticmethod
+    def from_dict(data: dict) -> 'GameEvent':
+        return GameEvent(data['kind'], data['frame'], data['time'], data['player'],
+                         [tuple(card) for card in data['cards']], data['points'],
+                         data.get('chips'))
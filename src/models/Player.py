@@ -1,10 +1,30 @@
 class Player:
+    __slots__ = ('name', 'prev_points', 'points', 'busted', 'coins', 'total_cards', 'prev_total_cards', 'raised',
+                 'bet', 'soft', 'blackjack')
+
     def __init__(self, name):
         self.name = name
         self.prev_points = 0
         self.points = 0
+        self.soft = False  # Whether an ace counts 11 in points
         self.busted = False
         self.coins = 0
         self.total_cards = 0
         self.prev_total_cards = 0
         self.raised = False
+        self.blackjack = False  # Whether blackjack was already announced in this game
+        self.bet = ()  # ids of chips in betting strip
+
+    def to_dict(self) -> dict:
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data['bet'] = list(self.bet)
+        return data
+
+    @staticmethod
+    def from_dict(data: dict) -> 'Player':
+        player = Player(data['name'])
+        for name in Player.__slots__:
+            if name in data:  # flags added later keep their defaults
+                setattr(player, name, data[name])
+        player.bet = tuple(player.bet)
+        return player
@@ -1,22 +1,56 @@
+import cv2
+import numpy as np
+
+
 class QueryCard:
     """Structure to store information about query cards in the camera image."""
 
+    __slots__ = ('contour', 'width', 'height', 'corner_pts', 'center', 'warp', 'rank_img', 'suit_img',
+                 'best_rank_match', 'best_suit_match', 'rank_diff', 'suit_diff', 'confidence', 'margin', 'size',
+                 'track_id', 'age')
+
     def __init__(self):
         self.contour = []  # Contour of card
         self.width, self.height = 0, 0  # Width and height of card
         self.corner_pts = []  # Corner points of card
         self.center = []  # Center point of card
-        self.warp = []  # 200x300, flattened, grayed, blurred image
+        self.warp = []  # Corner of card flattened to 200x300, grayed
         self.rank_img = []  # Thresholded, sized image of card's rank
         self.suit_img = []  # Thresholded, sized image of card's suit
         self.best_rank_match = "Unknown"  # Best matched rank
         self.best_suit_match = "Unknown"  # Best matched suit
         self.rank_diff = 0  # Difference between rank image and best matched train rank image
         self.suit_diff = 0  # Difference between suit image and best matched train suit image
-        self.half = None
-        self.side = None
+        self.confidence = 0.0  # Lower of rank and suit match confidences, from 0 to 1
+        self.margin = 0.0  # Lower of rank and suit margins over the closest template of other name
         self.size = 0
+        self.track_id = None  # Id of the track following this card between searches
+        self.age = 0  # For how many frames this card is tracked
+
+    def to_dict(self) -> dict:
+        """State of the card without images (warp, rank_img and suit_img). Outline is kept as its convex hull,
+        which has the same bounding rectangle."""
+        contour = cv2.convexHull(np.asarray(self.contour, dtype=np.int32))
+        return {'contour': contour.reshape(-1, 2).tolist(), 'width': int(self.width),
+                'height': int(self.height), 'corner_pts': np.asarray(self.corner_pts).reshape(-1, 2).tolist(),
+                'center': [int(v) for v in self.center], 'rank': self.best_rank_match, 'suit': self.best_suit_match,
+                'rank_diff': int(self.rank_diff), 'suit_diff': int(self.suit_diff),
+                'confidence': float(self.confidence), 'margin': float(self.margin), 'size': float(self.size),
+                'track_id': self.track_id, 'age': int(self.age)}
+
+    @staticmethod
+    def from_dict(data: dict) -> 'QueryCard':
+        card = QueryCard()
+        card.contour = np.array(data['contour'], dtype=np.int32).reshape(-1, 1, 2)
+        card.width, card.height = data['width'], data['height']
+        card.corner_pts = np.array(data['corner_pts'], dtype=np.float32).reshape(-1, 1, 2)
+        card.center = list(data['center'])
+        card.best_rank_match, card.best_suit_match = data['rank'], data['suit']
+        card.rank_diff, card.suit_diff = data['rank_diff'], data['suit_diff']
+        card.confidence, card.margin = data['confidence'], data['margin']
+        card.size, card.track_id, card.age = data['size'], data['track_id'], data['age']
+        return card
 
     def __call__(self):
         return self.best_rank_match + ' of ' + self.best_suit_match + ' with center in ' + str(
-            self.center[0]) + ', ' + str(self.center[1]) + ' so on ' + self.half + ' half'
+            self.center[0]) + ', ' + str(self.center[1])
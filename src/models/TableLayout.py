@@ -0,0 +1,114 @@
+import json
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+from numpy import ndarray
+
+from src.config import *
+
+Zone = Tuple[int, int, int, int]  # x, y, width, height
+
+# Labels of label map besides seats (which are labeled with their index)
+SHOE = 254
+HOLE = 253
+DISCARD = 252
+NO_ZONE = 255
+
+
+def pad_zone(zone: Zone, margin: int, width: int, height: int) -> Zone:
+    """Grow zone by margin on each side, but keep it inside the frame."""
+    x, y, w, h = zone
+    x0, y0 = max(0, x - margin), max(0, y - margin)
+    x1, y1 = min(width, x + w + margin), min(height, y + h + margin)
+    return x0, y0, max(0, x1 - x0), max(0, y1 - y0)
+
+
+def overlap(a: Zone, b: Zone) -> bool:
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+
+def union(a: Zone, b: Zone) -> Zone:
+    x0, y0 = min(a[0], b[0]), min(a[1], b[1])
+    x1, y1 = max(a[0] + a[2], b[0] + b[2]), max(a[1] + a[3], b[1] + b[3])
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def load_spec(path: Optional[str] = None) -> dict:
+    """Table spec from JSON file (see TABLE_SPEC), or TABLE_SPEC itself when path is None."""
+    if path is None:
+        return TABLE_SPEC
+    with open(path) as f:
+        return json.load(f)
+
+
+class TableLayout:
+    """Zones of the table where game happens, made from table spec (see TABLE_SPEC). Only they are
+    thresholded and searched. Label map gives zone of every pixel of the frame, so zone of a card
+    is one lookup."""
+
+    def __init__(self, spec: dict = None):
+        spec = load_spec(TABLE_SPEC_FILE) if spec is None else spec
+        self.seats = [dict(seat) for seat in spec['seats']]
+        if len(self.seats) < 1 or len(self.seats) > MAX_PLAYERS + 1:
+            raise ValueError('Table has to have dealer and at most ' + str(MAX_PLAYERS) + ' players')
+        self.polygons = {'shoe': spec.get('shoe', []), 'hole': spec.get('hole', []),
+                         'discard': spec.get('discard', [])}
+        self.label_map = np.full((IM_HEIGHT, IM_WIDTH), NO_ZONE, dtype=np.uint8)
+        # first zone a pixel is in wins, so zones are drawn from the last one
+        zones = [(self.polygons['shoe'], SHOE), (self.polygons['hole'], HOLE), (self.polygons['discard'], DISCARD)]
+        zones += [(seat['polygon'], i) for i, seat in enumerate(self.seats)]
+        for polygon, label in reversed(zones):
+            if len(polygon) > 0:
+                cv2.fillPoly(self.label_map, [np.array(polygon, dtype=np.int32)], int(label))
+                cv2.polylines(self.label_map, [np.array(polygon, dtype=np.int32)], True, int(label))
+
+    @property
+    def seat_names(self) -> List[str]:
+        return [seat['name'] for seat in self.seats]
+
+    @property
+    def card_zones(self) -> List[Zone]:
+        polygons = [seat['polygon'] for seat in self.seats] + list(self.polygons.values())
+        return [cv2.boundingRect(np.array(polygon, dtype=np.int32)) for polygon in polygons if len(polygon) > 0]
+
+    @property
+    def bets(self) -> List[Zone]:
+        """Betting strip of every player (without dealer), empty when player has none."""
+        return [tuple(seat.get('bet', (0, 0, 0, 0))) for seat in self.seats[1:]]
+
+    def zone_of(self, points: ndarray) -> ndarray:
+        """Label of zone (seat index, SHOE, HOLE, DISCARD or NO_ZONE) of every (x, y) point."""
+        points = np.asarray(points, dtype=np.intp).reshape(-1, 2)
+        x = np.clip(points[:, 0], 0, IM_WIDTH - 1)
+        y = np.clip(points[:, 1], 0, IM_HEIGHT - 1)
+        return self.label_map[y, x]
+
+    def card_regions(self, width: int = IM_WIDTH, height: int = IM_HEIGHT) -> List[Zone]:
+        """Card zones padded by half of threshold block (so threshold inside zone is the same as on whole
+        frame) and merged when they overlap, so no card is searched twice."""
+        regions = [pad_zone(zone, THRESH_BLOCK // 2 + 1, width, height) for zone in self.card_zones]
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(regions)):
+                for j in range(i + 1, len(regions)):
+                    if overlap(regions[i], regions[j]):
+                        regions[i] = union(regions[i], regions.pop(j))
+                        merged = True
+                        break
+                if merged:
+                    break
+        return [region for region in regions if region[2] > 0 and region[3] > 0]
+
+    def coin_strips(self, width: int = IM_WIDTH, height: int = IM_HEIGHT) -> List[Tuple[Zone, Zone]]:
+        """Betting strip of every player as (strip, region to search it), with region padded by coin
+        radius (whole circle has to be visible) and half of threshold block."""
+        return [(bet, pad_zone(bet, COIN_MAX_RADIUS + THRESH_BLOCK // 2 + 1, width, height)) for bet in self.bets]
+
+
+@lru_cache(maxsize=None)
+def default_layout() -> TableLayout:
+    """Layout of TABLE_SPEC (or TABLE_SPEC_FILE), made once and shared by all tables."""
+    return TableLayout()
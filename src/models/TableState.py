@@ -0,0 +1,58 @@
+from collections import deque
+
+from src.config import *
+from src.coins import CoinTracker
+from src.models.Game import Game
+from src.models.TableLayout import TableLayout, default_layout
+from src.overlay import Overlay
+from src.snapshot import pack_table, unpack_table
+from src.tracker import CardTracker
+
+
+class TableState:
+    """Structure to store everything one table (video stream) keeps between frames."""
+
+    def __init__(self, rank_bank, suit_bank, layout: TableLayout = None, sink=None, fps: float = 30.0):
+        self.rank_bank = rank_bank  # TemplateBank of ranks
+        self.suit_bank = suit_bank  # TemplateBank of suits
+        self.layout = default_layout() if layout is None else layout  # seats and zones of the table
+        self.tracker = CardTracker()  # follows cards between searches
+        self.coin_tracker = CoinTracker()  # finds coins only in changed betting strips, and follows them
+        self.game = None  # current Game, created on first frame and after each new game
+        self.new_game = True
+        self.frames = 0  # frames seen so far
+        self.overlay = Overlay()  # labels drawn on every output frame
+        self.winners = {'who': [], 'time': 0}  # winners to draw and for how many frames
+        self.hands = deque(maxlen=HAND_HISTORY)  # winners of last concluded hands
+        self.hand_count = 0  # hands concluded so far
+        self.sink = sink  # EventSink receiving events of every game, optional
+        self.fps = fps  # frames per second of the stream
+
+    def state(self) -> dict:
+        """Game state of the table after last search, without trackers, overlay and card images."""
+        return {'frames': self.frames, 'new_game': self.new_game, 'winners': dict(self.winners),
+                'hands': [list(who) for who in self.hands], 'hand_count': self.hand_count,
+                'game': self.game.state() if self.game is not None else None}
+
+    def restore(self, state: dict) -> None:
+        """Continues from state given by state(). Trackers start again, coins keep their ids."""
+        self.frames = state['frames']
+        self.new_game = state['new_game']
+        self.winners = dict(state['winners'])
+        self.hands = deque(state['hands'], maxlen=HAND_HISTORY)
+        self.hand_count = state['hand_count']
+        self.game = None
+        if state['game'] is not None:
+            self.game = Game.from_state(state['game'], self.sink, self.fps, self.layout)
+        self.tracker = CardTracker()
+        self.coin_tracker = CoinTracker()
+        self.coin_tracker.resume(self.game.coins if self.game is not None else [])
+        self.overlay = Overlay()
+
+    def snapshot(self) -> bytes:
+        """state() as small binary blob (see src/snapshot.py), e.g. to move the table to another worker."""
+        return pack_table(self.state(), self.layout.seat_names)
+
+    def restore_snapshot(self, data: bytes) -> None:
+        """Continues from blob given by snapshot()."""
+        self.restore(unpack_table(data, self.layout.seat_names))
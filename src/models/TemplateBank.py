@@ -0,0 +1,22 @@
+from typing import List
+
+import numpy as np
+
+
+class TemplateBank:
+    """Structure to store all train images of one kind stacked into a single tensor."""
+
+    def __init__(self, names: List[str], imgs: np.ndarray):
+        self.names = names  # Name of each template, in the same order as imgs
+        self.imgs = np.ascontiguousarray(imgs, dtype=np.uint8)  # T x height x width stack of train images
+        self.packed = pack_images(self.imgs)  # binarized, 64 pixels per word
+
+    def __len__(self):
+        return len(self.names)
+
+
+def pack_images(imgs: np.ndarray) -> np.ndarray:
+    """Binarizes N images and packs each into row of uint64 words (padded with zeros)."""
+    packed = np.packbits(imgs.reshape(len(imgs), -1) > 127, axis=1)
+    packed = np.pad(packed, ((0, 0), (0, -packed.shape[1] % 8)))
+    return np.ascontiguousarray(packed).view(np.uint64)
@@ -0,0 +1,11 @@
+class Track:
+    """Structure to store information about a card followed between searches."""
+
+    def __init__(self, track_id, card, match, frame):
+        self.track_id = track_id
+        self.card = card  # QueryCard from the search in which card was last matched
+        self.match = match  # (rank, suit, rank_diff, suit_diff, confidence, margin) from match_cards
+        self.first_seen = frame  # Frame in which track has started
+        self.last_seen = frame
+        self.since_match = 0  # Searches since card was last matched
+        self.misses = 0  # Searches in a row in which card was not found
@@ -0,0 +1,61 @@
+import cv2
+import numpy as np
+from numpy import ndarray
+
+from config import *
+
+
+class MotionGate:
+    """Decides on which frames search for cards should run. Frame is compared (downscaled and grayed)
+    with the frame of last search. Search runs at once when enough of the table has changed, but not
+    sooner than min_interval frames after last one. When nothing changes, the interval between
+    searches doubles, up to max_interval frames."""
+
+    def __init__(self, min_interval: int = SEARCH_MIN_INTERVAL, max_interval: int = SEARCH_MAX_INTERVAL,
+                 scale: int = MOTION_SCALE, pixel_thresh: int = MOTION_PIXEL_THRESH, area: float = MOTION_AREA):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.scale = scale
+        self.pixel_thresh = pixel_thresh
+        self.area = area
+        self.interval = min_interval  # current interval when nothing moves
+        self.since_search = 0  # frames since last search
+        self.reference = None  # small frame from last search
+
+    def small(self, frame: ndarray) -> ndarray:
+        h, w = frame.shape[:2]
+        small = cv2.resize(frame, (max(1, w // self.scale), max(1, h // self.scale)), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small
+
+    def motion(self, small: ndarray) -> float:
+        """Fraction of pixels that changed since last search."""
+        changed = cv2.absdiff(small, self.reference) > self.pixel_thresh
+        return float(np.count_nonzero(changed)) / changed.size
+
+    def needs_frame(self) -> bool:
+        """Whether next frame has to be decoded and given to should_search, when motion is checked only
+        every min_interval frames (and when search is due). Otherwise skip() can be called instead."""
+        since_search = self.since_search + 1
+        return self.reference is None or since_search >= self.interval or since_search % self.min_interval == 0
+
+    def skip(self) -> None:
+        self.since_search += 1
+
+    def should_search(self, frame: ndarray) -> bool:
+        self.since_search += 1
+        if self.reference is not None and self.since_search < self.min_interval:
+            return False
+
+        small = self.small(frame)
+        if self.reference is None or self.motion(small) >= self.area:
+            self.interval = self.min_interval  # something happens on the table, keep searching often
+        elif self.since_search >= self.interval:
+            self.interval = min(self.interval * 2, self.max_interval)  # still nothing, back off
+        else:
+            return False
+
+        self.reference = small
+        self.since_search = 0
+        return True
@@ -0,0 +1,123 @@
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+from numpy import ndarray
+
+from config import *
+from src.profiling import timed
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+Color = Tuple[int, int, int]
+
+
+class Sprite:
+    """Text rendered once, premultiplied by its alpha, to be blended onto frames."""
+
+    def __init__(self, premult: ndarray, inv_alpha: ndarray, offset: Tuple[int, int]):
+        self.premult = premult  # h x w x 3 uint8, color * alpha
+        self.inv_alpha = inv_alpha  # h x w x 3 uint8, 255 * (1 - alpha)
+        self.offset = offset  # position of text origin (bottom-left) inside sprite
+
+
+def render_text(text: str, scale: float, color: Color, thickness: int, outline: Optional[Color] = None,
+                outline_thickness: int = 0) -> Sprite:
+    """Renders text as cv2.putText would, first with outline (if given) and then with fill on top of it."""
+    border = max(thickness, outline_thickness)
+    (w, h), baseline = cv2.getTextSize(text, FONT, scale, border)
+    offset = (border, border + h)
+    size = (h + baseline + 2 * border, w + 2 * border)
+
+    fill = np.zeros(size, dtype=np.uint8)
+    cv2.putText(fill, text, offset, FONT, scale, 255, thickness, cv2.LINE_AA)
+    alpha = fill.astype(np.float32)[:, :, None] / 255
+    premult = alpha * np.array(color, dtype=np.float32)
+    if outline is not None:
+        edge = np.zeros(size, dtype=np.uint8)
+        cv2.putText(edge, text, offset, FONT, scale, 255, outline_thickness, cv2.LINE_AA)
+        edge_alpha = edge.astype(np.float32)[:, :, None] / 255 * (1 - alpha)  # part visible under fill
+        premult += edge_alpha * np.array(outline, dtype=np.float32)
+        alpha += edge_alpha
+    inv_alpha = np.repeat((1 - alpha) * 255 + 0.5, 3, axis=2)
+    return Sprite((premult + 0.5).astype(np.uint8), inv_alpha.astype(np.uint8), offset)
+
+
+class Placement:
+    """Part of sprite that lies inside frame of given size, with text origin at org."""
+
+    def __init__(self, sprite: Sprite, org: Tuple[int, int], frame_shape: Tuple[int, int]):
+        x, y = org[0] - sprite.offset[0], org[1] - sprite.offset[1]
+        h, w = sprite.premult.shape[:2]
+        self.x0, self.y0 = max(x, 0), max(y, 0)
+        self.x1, self.y1 = min(x + w, frame_shape[1]), min(y + h, frame_shape[0])
+        self.visible = self.x0 < self.x1 and self.y0 < self.y1
+        sx, sy = self.x0 - x, self.y0 - y
+        self.premult = np.ascontiguousarray(sprite.premult[sy:sy + self.y1 - self.y0, sx:sx + self.x1 - self.x0])
+        self.inv_alpha = np.ascontiguousarray(sprite.inv_alpha[sy:sy + self.y1 - self.y0, sx:sx + self.x1 - self.x0])
+
+    def blend(self, image: ndarray) -> None:
+        """Draws sprite onto image in place: image * (1 - alpha) + color * alpha."""
+        if not self.visible:
+            return
+        roi = image[self.y0:self.y1, self.x0:self.x1]
+        cv2.multiply(roi, self.inv_alpha, dst=roi, scale=1 / 255)
+        cv2.add(roi, self.premult, dst=roi)
+
+
+class SpriteCache:
+    """Rendered sprites of recently drawn labels, least recently used are evicted above size."""
+
+    def __init__(self, size: int = OVERLAY_CACHE_SIZE):
+        self.size = size
+        self.sprites = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text: str, scale: float, color: Color, thickness: int, outline: Optional[Color] = None,
+            outline_thickness: int = 0) -> Sprite:
+        key = (text, scale, color, thickness, outline, outline_thickness)
+        sprite = self.sprites.get(key)
+        if sprite is not None:
+            self.hits += 1
+            self.sprites.move_to_end(key)
+            return sprite
+        self.misses += 1
+        sprite = render_text(text, scale, color, thickness, outline, outline_thickness)
+        self.sprites[key] = sprite
+        if len(self.sprites) > self.size:
+            self.sprites.popitem(last=False)
+        return sprite
+
+
+class Overlay:
+    """Text layer drawn on every output frame. Labels are set only when what they show changes
+    (see key), in between frames cached sprites are only blended."""
+
+    def __init__(self, cache: SpriteCache = None):
+        self.cache = SpriteCache() if cache is None else cache
+        self.labels = []  # (sprite, origin) in drawing order
+        self.key = None  # state the labels were made for
+        self.placements = None  # labels placed on frame of frame_shape
+        self.frame_shape = None
+
+    def clear(self, key=None) -> None:
+        self.labels = []
+        self.key = key
+        self.placements = None
+
+    def text(self, text: str, org: Tuple[int, int], scale: float, color: Color, thickness: int,
+             outline: Optional[Color] = None, outline_thickness: int = 0) -> None:
+        """Same arguments as cv2.putText, with optional outline drawn below the text."""
+        self.labels.append((self.cache.get(text, scale, color, thickness, outline, outline_thickness), org))
+        self.placements = None
+
+    @timed('draw_overlay')
+    def draw(self, image: ndarray) -> ndarray:
+        if self.placements is None or self.frame_shape != image.shape[:2]:
+            self.frame_shape = image.shape[:2]
+            self.placements = [Placement(sprite, org, self.frame_shape) for sprite, org in self.labels]
+        for placement in self.placements:
+            placement.blend(image)
+        return image
@@ -0,0 +1,128 @@
+import queue
+import threading
+import time
+from typing import Callable, List, Optional
+
+from numpy import ndarray
+
+from src.profiling import profiler
+
+END = None  # put in queue after last frame
+
+
+class StageStats:
+    """Number of frames and time spent on work (without waiting for queues) by one pipeline stage."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.frames = 0
+        self.busy = 0.0
+
+    @property
+    def fps(self) -> float:
+        return self.frames / self.busy if self.busy > 0 else 0.0
+
+    def __str__(self):
+        return self.name + ': ' + str(self.frames) + ' frames, ' + str(round(self.busy, 2)) + ' s busy, ' + str(
+            round(self.fps, 1)) + ' fps'
+
+
+def put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """Blocking put, which gives up when other stage has failed. Bounded queue gives backpressure."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def get(q: queue.Queue, stop: threading.Event):
+    """Blocking get, which gives up (returns END) when other stage has failed."""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return END
+
+
+def run_pipeline(cap, out, process: Callable[[ndarray, int], ndarray], queue_size: int = 8,
+                 max_frames: Optional[int] = None) -> List[StageStats]:
+    """Runs capture, processing and writing of video in separate stages connected with bounded queues.
+    cap.read() and out.write() run in their own threads, process(frame, frame_number) in the calling
+    thread, one frame after another, so output frames keep their order. Returns stats of each stage."""
+
+    read_q = queue.Queue(maxsize=queue_size)
+    write_q = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+    read_stats, process_stats, write_stats = StageStats('read'), StageStats('process'), StageStats('write')
+
+    def reader():
+        try:
+            frames_count = 0
+            while max_frames is None or frames_count < max_frames:
+                start = time.perf_counter()
+                ret, frame = cap.read()
+                elapsed = time.perf_counter() - start
+                read_stats.busy += elapsed
+                if profiler.enabled:
+                    profiler.add('video_read', elapsed)
+                if not ret:
+                    break
+                frames_count += 1
+                read_stats.frames += 1
+                if not put(read_q, (frames_count, frame), stop):
+                    return
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            put(read_q, END, stop)
+
+    def writer():
+        try:
+            while True:
+                frame = get(write_q, stop)
+                if frame is END:
+                    break
+                start = time.perf_counter()
+                out.write(frame)
+                elapsed = time.perf_counter() - start
+                write_stats.busy += elapsed
+                if profiler.enabled:
+                    profiler.add('video_write', elapsed)
+                write_stats.frames += 1
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+
+    threads = [threading.Thread(target=reader, daemon=True), threading.Thread(target=writer, daemon=True)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            item = get(read_q, stop)
+            if item is END:
+                break
+            frames_count, frame = item
+            start = time.perf_counter()
+            frame = process(frame, frames_count)
+            process_stats.busy += time.perf_counter() - start
+            process_stats.frames += 1
+            if not put(write_q, frame, stop):
+                break
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        put(write_q, END, stop)
+        for thread in threads:
+            thread.join()
+
+    if len(errors) > 0:
+        raise errors[0]
+    return [read_stats, process_stats, write_stats]
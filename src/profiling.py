@@ -0,0 +1,109 @@
+import cProfile
+import csv
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, Iterable
+
+import numpy as np
+
+from config import *
+
+
+class Profiler:
+    """Collects durations of pipeline stages. Keeps last `window` durations of every stage, so
+    percentiles are rolling. When disabled, timed functions only check the flag."""
+
+    def __init__(self, enabled: bool = PROFILE, window: int = PROFILE_WINDOW):
+        self.enabled = enabled
+        self.window = window
+        self.times: Dict[str, deque] = {}
+        self.counts: Dict[str, int] = {}
+        self.totals: Dict[str, float] = {}
+        self.lock = threading.Lock()  # read and write stages run in their own threads
+        self.capture_frames = set()  # frames profiled with cProfile
+        self.capture = None
+
+    def add(self, name: str, seconds: float) -> None:
+        with self.lock:
+            if name not in self.times:
+                self.times[name] = deque(maxlen=self.window)
+                self.counts[name] = 0
+                self.totals[name] = 0.0
+            self.times[name].append(seconds)
+            self.counts[name] += 1
+            self.totals[name] += seconds
+
+    def reset(self) -> None:
+        with self.lock:
+            self.times, self.counts, self.totals = {}, {}, {}
+
+    def summary(self) -> Dict[str, dict]:
+        """Count, total and rolling mean/p50/p95/p99 (in milliseconds) of every stage."""
+        with self.lock:
+            result = {}
+            for name, times in self.times.items():
+                p50, p95, p99 = np.percentile(np.array(times) * 1000, [50, 95, 99])
+                result[name] = {'count': self.counts[name], 'total_s': self.totals[name],
+                                'mean_ms': float(np.mean(times)) * 1000, 'p50_ms': float(p50),
+                                'p95_ms': float(p95), 'p99_ms': float(p99)}
+            return result
+
+    def write_report(self, path: str) -> None:
+        """Saves summary as CSV (when path ends with .csv) or JSON."""
+        summary = self.summary()
+        with open(path, 'w', newline='') as f:
+            if path.endswith('.csv'):
+                writer = csv.writer(f)
+                writer.writerow(['stage', 'count', 'total_s', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms'])
+                for name, stats in sorted(summary.items()):
+                    writer.writerow([name] + [stats[key] for key in
+                                              ('count', 'total_s', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms')])
+            else:
+                json.dump(summary, f, indent=2)
+
+    def capture_on(self, frames: Iterable[int]) -> None:
+        """Run cProfile on given frame numbers (in thread calling frame())."""
+        self.capture_frames = set(frames)
+        self.capture = cProfile.Profile() if len(self.capture_frames) > 0 else None
+
+    @contextmanager
+    def frame(self, frame_number: int):
+        if self.capture is None or frame_number not in self.capture_frames:
+            yield
+            return
+        self.capture.enable()
+        try:
+            yield
+        finally:
+            self.capture.disable()
+
+    def dump_capture(self, path: str) -> None:
+        """Saves cProfile stats of captured frames, readable with pstats or snakeviz."""
+        if self.capture is not None:
+            self.capture.dump_stats(path)
+
+
+profiler = Profiler()
+
+
+def timed(name: str):
+    """Decorator adding duration of every call to profiler under given stage name."""
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.add(name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,33 @@
+from typing import Tuple
+
+import numpy as np
+from numpy import ndarray
+
+from src.models.CardSet import CardSet, RANK_NAMES, RANK_IDS
+from src.models.TableLayout import HOLE, SHOE
+
+# Hard value of every rank id, ace counts 1 (and 10 more in soft hand)
+HARD_POINTS = np.array([{'Ace': 1, 'Two': 2, 'Three': 3, 'Four': 4, 'Five': 5, 'Six': 6, 'Seven': 7, 'Eight': 8,
+                         'Nine': 9, 'Ten': 10, 'Jack': 10, 'Queen': 10, 'King': 10}.get(name, 0)
+                        for name in RANK_NAMES], dtype=np.int32)
+ACE = RANK_IDS['Ace']
+
+
+def hand_seats(cards: CardSet, seats: int) -> ndarray:
+    """Seat whose hand every card belongs to, -1 for cards of no hand. Cards in hole and shoe are
+    dealer's (deck itself has no rank, cards lying on it are counted)."""
+    seat = cards.zones.astype(np.intp)
+    seat[(seat == HOLE) | (seat == SHOE)] = 0
+    seat[seat >= seats] = -1
+    return seat
+
+
+def score_hands(cards: CardSet, seats: int) -> Tuple[ndarray, ndarray]:
+    """Points of every seat and whether it is soft (an ace counts 11), all in one pass over cards.
+    Aces count 1, and one of them 11 when that does not go over 21."""
+    seat = hand_seats(cards, seats)
+    inside = seat >= 0
+    hard = np.bincount(seat[inside], weights=HARD_POINTS[cards.rank_ids[inside]], minlength=seats)
+    aces = np.bincount(seat[inside], weights=cards.rank_ids[inside] == ACE, minlength=seats)
+    soft = (aces > 0) & (hard + 10 <= 21)
+    return (hard + 10 * soft).astype(int), soft
@@ -0,0 +1,292 @@
+import argparse
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import cv2
+from numpy import ndarray
+
+from config import *
+from src.bank import load_banks
+from src.events import open_sink
+from src.main import next_frame, search_table, update_winners
+from src.models.TableState import TableState
+from src.motion import MotionGate
+
+END = None  # put in frame queue after last frame
+
+
+class FrameSource:
+    """Stand-in for a camera: video file, or directory with one image per frame (in name order).
+    In realtime mode frames are given no faster than fps, as a camera would."""
+
+    def __init__(self, path: str, realtime: bool = True, fps: float = 30.0):
+        self.path = path
+        self.realtime = realtime
+        self.cap = None
+        self.files = None
+        if os.path.isdir(path):
+            self.files = sorted(os.path.join(path, name) for name in os.listdir(path)
+                                if name.lower().endswith(FRAME_EXTENSIONS))
+            self.fps = fps
+        else:
+            self.cap = cv2.VideoCapture(path)
+            if not self.cap.isOpened():
+                raise FileNotFoundError('Video ' + path + ' was not found')
+            self.fps = self.cap.get(cv2.CAP_PROP_FPS) or fps
+        self.position = 0  # frames given so far
+        self.start = None
+
+    def grab(self) -> bool:
+        """Moves to next frame, without decoding it when possible."""
+        if self.realtime:
+            if self.start is None:
+                self.start = time.perf_counter()
+            delay = self.start + self.position / self.fps - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        if self.cap is not None:
+            ok = self.cap.grab()
+        else:
+            ok = self.position < len(self.files)
+        if ok:
+            self.position += 1
+        return ok
+
+    def retrieve(self) -> Optional[ndarray]:
+        """Decodes frame moved to with grab()."""
+        if self.cap is not None:
+            ret, frame = self.cap.retrieve()
+            return frame if ret else None
+        return cv2.imread(self.files[self.position - 1])
+
+    def release(self) -> None:
+        if self.cap is not None:
+            self.cap.release()
+
+
+class TableStream:
+    """One table: its source decoded in own thread, and its own game state. Decode thread looks at
+    frames with MotionGate, and queues only the ones to search. When detection falls behind,
+    the oldest queued frames are dropped."""
+
+    def __init__(self, name: str, source: FrameSource, rank_bank, suit_bank, events_path: Optional[str] = None,
+                 queue_size: int = SERVER_QUEUE_SIZE):
+        self.name = name
+        self.source = source
+        sink = open_sink(events_path) if events_path is not None else None
+        self.table = TableState(rank_bank, suit_bank, sink=sink, fps=source.fps)
+        self.gate = MotionGate()
+        self.frames = deque()  # (frame number, frame) waiting for detection
+        self.queue_size = queue_size
+        self.lock = threading.Condition()
+        self.ready = None  # asyncio.Event set when frame is queued
+        self.loop = None
+        self.thread = None
+        self.stop = threading.Event()
+        self.read = 0  # frames read from source
+        self.decoded = 0
+        self.dropped = 0  # frames to search dropped because detection was behind
+        self.searched = 0
+        self.busy = 0.0  # seconds of detection
+        self.error = None
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+        self.ready = asyncio.Event()
+        self.thread = threading.Thread(target=self.decode, name='decode-' + self.name, daemon=True)
+        self.thread.start()
+
+    def push(self, item) -> None:
+        with self.lock:
+            if not self.source.realtime:
+                # file is read as fast as detection goes, so nothing has to be dropped
+                while len(self.frames) >= self.queue_size and not self.stop.is_set():
+                    self.lock.wait(0.1)
+            elif item is not END and len(self.frames) >= self.queue_size:
+                self.frames.popleft()
+                self.dropped += 1
+            self.frames.append(item)
+        self.loop.call_soon_threadsafe(self.ready.set)
+
+    def pop(self):
+        with self.lock:
+            item = self.frames.popleft() if len(self.frames) > 0 else False
+            self.lock.notify()
+            return item
+
+    def decode(self) -> None:
+        try:
+            while not self.stop.is_set() and self.source.grab():
+                self.read += 1
+                if not self.gate.needs_frame():
+                    self.gate.skip()
+                    continue
+                frame = self.source.retrieve()
+                if frame is None:
+                    break
+                self.decoded += 1
+                if self.gate.should_search(frame):
+                    self.push((self.read, frame))
+        except Exception as e:
+            self.error = e
+        finally:
+            self.source.release()
+            self.push(END)
+
+    async def next_item(self):
+        """Next queued frame, or END when source has finished."""
+        while True:
+            item = self.pop()
+            if item is not False:
+                return item
+            self.ready.clear()
+            item = self.pop()  # frame could come between pop and clear
+            if item is not False:
+                return item
+            await self.ready.wait()
+
+    def search(self, frame_number: int, frame: ndarray) -> None:
+        """Detection on one frame, runs in worker pool (never two frames of one table at once)."""
+        start = time.perf_counter()
+        table = self.table
+        next_frame(table, frame_number)
+        search_table(frame, table)
+        update_winners(table)
+        self.searched += 1
+        self.busy += time.perf_counter() - start
+
+    def close(self) -> None:
+        self.stop.set()
+        if self.thread is not None:
+            self.thread.join()
+        if self.table.sink is not None:
+            self.table.sink.close()
+
+    def summary(self) -> dict:
+        summary = {'table': self.name, 'source': self.source.path, 'frames': self.read, 'decoded': self.decoded,
+                   'searched': self.searched, 'dropped': self.dropped, 'busy': self.busy,
+                   'hands': list(self.table.hands), 'hand_count': self.table.hand_count}
+        if self.error is not None:
+            summary['error'] = repr(self.error)
+        return summary
+
+
+class FairScheduler:
+    """Gives worker slots to tables in order in which they asked for them. Every table asks for one
+    slot at a time, so busy tables cannot starve others."""
+
+    def __init__(self, slots: int):
+        self.free = slots
+        self.waiting = deque()
+
+    async def acquire(self) -> None:
+        if self.free > 0 and len(self.waiting) == 0:
+            self.free -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.append(future)
+        await future  # slot is handed over by release()
+
+    def release(self) -> None:
+        while len(self.waiting) > 0:
+            future = self.waiting.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.free += 1
+
+
+class TableServer:
+    """Runs detection of many tables in one process. Each table decodes in its own thread, detection
+    of all tables shares pool of worker threads (OpenCV and NumPy release GIL for heavy work)."""
+
+    def __init__(self, streams: List[TableStream], workers: int = SERVER_WORKERS):
+        self.streams = streams
+        self.workers = workers
+        self.scheduler = FairScheduler(workers)
+        self.pool = None
+
+    async def run_table(self, stream: TableStream) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await stream.next_item()
+            if item is END:
+                break
+            frame_number, frame = item
+            await self.scheduler.acquire()
+            try:
+                await loop.run_in_executor(self.pool, stream.search, frame_number, frame)
+            finally:
+                self.scheduler.release()
+
+    async def run(self) -> List[dict]:
+        loop = asyncio.get_running_loop()
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='detect')
+        try:
+            for stream in self.streams:
+                stream.start(loop)
+            results = await asyncio.gather(*(self.run_table(stream) for stream in self.streams),
+                                           return_exceptions=True)
+        finally:
+            for stream in self.streams:
+                stream.close()
+            self.pool.shutdown()
+        summaries = [stream.summary() for stream in self.streams]
+        for summary, result in zip(summaries, results):
+            if isinstance(result, BaseException):
+                summary['error'] = repr(result)
+        return summaries
+
+
+def open_streams(sources: List[str], rank_bank, suit_bank, events_dir: Optional[str] = None,
+                 realtime: bool = True, fps: float = 30.0) -> List[TableStream]:
+    """One stream per source, named after it. Events of each go to events_dir/<name>.jsonl."""
+    streams = []
+    names = set()
+    for source in sources:
+        name = os.path.splitext(os.path.basename(os.path.normpath(source)))[0]
+        while name in names:
+            name += '_'
+        names.add(name)
+        events_path = os.path.join(events_dir, name + '.jsonl') if events_dir is not None else None
+        streams.append(TableStream(name, FrameSource(source, realtime, fps), rank_bank, suit_bank, events_path))
+    return streams
+
+
+def serve(sources: List[str], templates_path: str = 'Card_Imgs/', events_dir: Optional[str] = None,
+          workers: int = SERVER_WORKERS, realtime: bool = True, fps: float = 30.0) -> Tuple[List[dict], float]:
+    """Runs all sources to the end. Returns summary of every table and wall time."""
+    rank_bank, suit_bank = load_banks(templates_path)
+    if events_dir is not None:
+        os.makedirs(events_dir, exist_ok=True)
+    start = time.perf_counter()
+    summaries = asyncio.run(TableServer(open_streams(sources, rank_bank, suit_bank, events_dir, realtime, fps),
+                                        workers).run())
+    return summaries, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Detect games on many tables at once, in one process.')
+    parser.add_argument('sources', nargs='+', help='video files or directories of frames, one per table')
+    parser.add_argument('--events', default=None, help='directory for events of every table (JSON lines)')
+    parser.add_argument('--templates', default='Card_Imgs/', help='directory with train images')
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS, help='detection threads shared by tables')
+    parser.add_argument('--fps', type=float, default=30.0, help='frame rate of directories of frames')
+    parser.add_argument('--fast', action='store_true',
+                        help='read sources as fast as detection goes, instead of at their frame rate')
+    args = parser.parse_args()
+
+    summaries, wall = serve(args.sources, args.templates, args.events, args.workers, not args.fast, args.fps)
+    for summary in summaries:
+        if 'error' in summary:
+            print(summary['table'] + ': ' + summary['error'])
+        print(summary['table'] + ': ' + str(summary['frames']) + ' frames, ' + str(summary['searched']) +
+              ' searched, ' + str(summary['dropped']) + ' dropped, ' + str(round(summary['busy'], 1)) +
+              ' s of detection, ' + str(summary['hand_count']) + ' hands')
+    frames = sum(summary['frames'] for summary in summaries)
+    print('Total: ' + str(len(summaries)) + ' tables, ' + str(frames) + ' frames in ' + str(round(wall, 1)) + ' s')
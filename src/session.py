@@ -0,0 +1,272 @@
+import argparse
+import struct
+import time
+from bisect import bisect_left
+from typing import BinaryIO, List, Optional, Tuple
+
+import cv2
+from numpy import ndarray
+
+from config import *
+from src.bank import load_banks
+from src.events import open_sink, EventSink
+from src.main import next_frame, search_table, update_winners, draw_table
+from src.models.TableState import TableState
+from src.models.TemplateBank import TemplateBank
+from src.motion import MotionGate
+from src.snapshot import pack_table, unpack_table
+
+INDEX_MAGIC = b'BJSI'
+INDEX_VERSION = 2
+HEADER = struct.Struct('<dB')  # fps and number of seats, then video path and seat names
+RECORD = struct.Struct('<BIdIII')  # kind, frame, time in ms, game, hand_count and length of table snapshot
+SEARCH, END = 0, 1  # kinds of records, END carries number of frames analyzed
+
+
+def write_text(file: BinaryIO, text: str) -> None:
+    data = text.encode()
+    file.write(struct.pack('<H', len(data)) + data)
+
+
+def read_text(file: BinaryIO) -> str:
+    length, = struct.unpack('<H', file.read(2))
+    return file.read(length).decode()
+
+
+class SessionIndexWriter:
+    """Writes session index: for every search, its frame and time in the video and snapshot of the
+    table after it (see TableState.snapshot). Snapshots leave out the history of hands, as winners of the
+    hand a search concluded are in the snapshot of that search. File starts with magic, version and header,
+    and ends with record of the number of frames analyzed."""
+
+    def __init__(self, path: str, video: str, fps: float, seats: List[str]):
+        self.file = open(path, 'wb')
+        self.games = 0  # games seen so far
+        self.game = None  # last game seen, to count new ones
+        self.records = 0
+        self.seats = list(seats)
+        self.file.write(INDEX_MAGIC + bytes([INDEX_VERSION]) + HEADER.pack(fps, len(seats)))
+        for text in [video] + list(seats):
+            write_text(self.file, text)
+
+    def add(self, table: TableState, msec: float) -> None:
+        """Records state of the table after search of its current frame."""
+        if table.game is not self.game:
+            self.game = table.game
+            self.games += 1
+        snapshot = pack_table(dict(table.state(), hands=[]), self.seats)
+        self.file.write(RECORD.pack(SEARCH, table.frames, msec, self.games, table.hand_count, len(snapshot)))
+        self.file.write(snapshot)
+        self.records += 1
+
+    def close(self, frames: int) -> None:
+        self.file.write(RECORD.pack(END, frames, 0.0, 0, 0, 0))
+        self.file.close()
+
+
+class SessionIndex:
+    """Session index read from file written by SessionIndexWriter. Only records are read at once,
+    snapshots are read by table() when needed."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records = []
+        self.concluding = []  # records of searches which concluded a hand
+        self.analyzed = 0  # frames analyzed, searches are known only up to the last one when END is missing
+        with open(path, 'rb') as file:
+            if file.read(len(INDEX_MAGIC) + 1) != INDEX_MAGIC + bytes([INDEX_VERSION]):
+                raise ValueError(path + ' is not session index of version ' + str(INDEX_VERSION))
+            self.fps, seats = HEADER.unpack(file.read(HEADER.size))
+            self.video = read_text(file)
+            self.seats = [read_text(file) for _ in range(seats)]
+            while True:
+                data = file.read(RECORD.size)
+                if len(data) < RECORD.size:
+                    break
+                kind, frame, msec, game, hand_count, length = RECORD.unpack(data)
+                if kind == END:
+                    self.analyzed = frame
+                    break
+                self.records.append({'frame': frame, 'msec': msec, 'game': game, 'hand_count': hand_count,
+                                     'offset': file.tell(), 'length': length})
+                if hand_count > len(self.concluding):
+                    self.concluding.append(self.records[-1])
+                self.analyzed = frame
+                file.seek(length, 1)
+        self.frames = [record['frame'] for record in self.records]  # frames of searches, ascending
+
+    def read(self, record: dict) -> dict:
+        """Game state of the table stored with the record, without history of hands."""
+        with open(self.path, 'rb') as file:
+            file.seek(record['offset'])
+            return unpack_table(file.read(record['length']), self.seats)
+
+    def winners(self, number: int) -> List[str]:
+        """Winners of hand with given number (counted from 1)."""
+        record = self.concluding[number - 1]
+        if 'winners' not in record:
+            record['winners'] = self.read(record)['winners']['who']
+        return record['winners']
+
+    def table(self, record: dict) -> dict:
+        """Game state of the table after search of the record (see TableState.state), with history of hands
+        gathered from the searches which concluded them."""
+        state = self.read(record)
+        first = max(1, record['hand_count'] - HAND_HISTORY + 1)
+        state['hands'] = [self.winners(number) for number in range(first, record['hand_count'] + 1)]
+        return state
+
+    def before(self, frame: int) -> Optional[dict]:
+        """Last record of search before given frame, None when there is none."""
+        i = bisect_left(self.frames, frame)
+        return self.records[i - 1] if i > 0 else None
+
+    def frame_at(self, seconds: float) -> int:
+        """Frame (counted from 1) shown at given time of the video."""
+        return int(seconds * self.fps) + 1
+
+    def hand(self, number: int) -> Tuple[int, Optional[int]]:
+        """First and last frame of the game in which hand with given number (counted from 1) has concluded,
+        last frame is None when game lasts until the end of the video. Game ends with its last search."""
+        game = next((record['game'] for record in self.records if record['hand_count'] >= number), None)
+        if game is None:
+            raise ValueError('Hand ' + str(number) + ' is not in the index')
+        before = [record['frame'] for record in self.records if record['game'] < game]
+        during = [record['frame'] for record in self.records if record['game'] == game]
+        start = before[-1] + 1 if len(before) > 0 else 1  # game is created on frame after the last one ended
+        end = during[-1] if during[-1] < self.frames[-1] else None
+        return start, end
+
+    def hands(self) -> List[dict]:
+        """Every concluded hand, with its winners and frames of its game."""
+        hands = []
+        for record in self.concluding:
+            start, end = self.hand(record['hand_count'])
+            hands.append({'hand': record['hand_count'], 'frame': record['frame'], 'start': start, 'end': end,
+                          'winners': self.winners(record['hand_count'])})
+        return hands
+
+
+def seek(cap: cv2.VideoCapture, frames: int) -> bool:
+    """Moves capture after given number of frames. Container is asked to seek first, when it cannot,
+    frames are grabbed one by one."""
+    if frames == 0:
+        return True
+    if cap.set(cv2.CAP_PROP_POS_FRAMES, frames) and int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == frames:
+        return True
+    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    for _ in range(frames):
+        if not cap.grab():
+            return False
+    return True
+
+
+def replay(input_path: str, index: SessionIndex, rank_bank: TemplateBank, suit_bank: TemplateBank,
+           start_frame: int = 1, end_frame: Optional[int] = None, output_path: Optional[str] = None,
+           events_path: Optional[str] = None) -> dict:
+    """Processes only frames start_frame..end_frame (counted from 1, end included, None for the end of video).
+    Game state is restored from the last search before start_frame, and search runs on the same frames
+    as when index was written (after the analyzed frames, on frames chosen by MotionGate). Writes
+    video of the segment to output_path and its events to events_path, when given."""
+
+    start = time.perf_counter()
+    cap = cv2.VideoCapture(input_path)
+    if not cap.isOpened() or int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) <= 0:
+        cap.release()
+        return {'file': input_path, 'error': 'Video was not found'}
+    fps = cap.get(cv2.CAP_PROP_FPS) or index.fps
+
+    sink = open_sink(events_path) if events_path is not None else EventSink()
+    table = TableState(rank_bank, suit_bank, sink=sink, fps=fps)
+    record = index.before(start_frame)
+    if record is not None:
+        table.restore(index.table(record))
+    hands_before = table.hand_count
+    if not seek(cap, table.frames):
+        cap.release()
+        sink.close()
+        return {'file': input_path, 'error': 'Video is shorter than the index'}
+
+    out = None
+    if output_path is not None:
+        size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'MP4V'), fps, size)
+
+    searches = set(index.frames)
+    gate = MotionGate()
+    processed = searched = 0
+    try:
+        while (end_frame is None or table.frames < end_frame) and cap.grab():
+            next_frame(table)
+            processed += 1
+            writing = out is not None and table.frames >= start_frame
+            if table.frames <= index.analyzed:
+                search = table.frames in searches
+                frame: Optional[ndarray] = None
+                if search or writing:
+                    ret, frame = cap.retrieve()
+                    if not ret:
+                        break
+            else:
+                ret, frame = cap.retrieve()
+                if not ret:
+                    break
+                search = gate.should_search(frame)
+
+            if search:
+                searched += 1
+                search_table(frame, table)
+            if writing:
+                out.write(draw_table(frame, table))
+            if search:
+                update_winners(table)
+    finally:
+        cap.release()
+        if out is not None:
+            out.release()
+        sink.close()
+
+    wall = time.perf_counter() - start
+    return {'file': input_path, 'start': start_frame, 'end': table.frames, 'frames': processed,
+            'searches': searched, 'events': sink.count, 'wall_time': wall,
+            'hands': list(table.hands)[len(table.hands) - (table.hand_count - hands_before):],
+            'hand_count': table.hand_count, 'table': table.state()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Replay one hand or part of a recording from its session index '
+                                                 '(written by: python src/headless.py video --index file).')
+    parser.add_argument('video')
+    parser.add_argument('index')
+    parser.add_argument('--hand', type=int, default=None, help='number of concluded hand, counted from 1')
+    parser.add_argument('--time', type=float, default=None, help='start, in seconds from start of the video')
+    parser.add_argument('--frame', type=int, default=None, help='start, in frames counted from 1')
+    parser.add_argument('--end', type=int, default=None, help='last frame (default: end of hand, or of video)')
+    parser.add_argument('--output', default=None, help='video of the segment')
+    parser.add_argument('--events', default=None, help='file for events of the segment (default: print them)')
+    parser.add_argument('--templates', default='Card_Imgs/', help='directory with train images')
+    args = parser.parse_args()
+
+    index = SessionIndex(args.index)
+    if args.hand is None and args.time is None and args.frame is None:
+        for hand in index.hands():
+            print('hand ' + str(hand['hand']) + ': frames ' + str(hand['start']) + '-' + str(hand['end']) +
+                  ', winners ' + ', '.join(hand['winners']))
+    else:
+        start_frame, end_frame = 1, args.end
+        if args.hand is not None:
+            start_frame, end_frame = index.hand(args.hand)
+            end_frame = args.end if args.end is not None else end_frame
+        elif args.time is not None:
+            start_frame = index.frame_at(args.time)
+        else:
+            start_frame = args.frame
+        rank_bank, suit_bank = load_banks(args.templates)
+        events_path = args.events if args.events is not None else '-'
+        summary = replay(args.video, index, rank_bank, suit_bank, start_frame, end_frame, args.output, events_path)
+        if 'error' in summary:
+            print(summary['error'])
+        else:
+            print('frames ' + str(summary['start']) + '-' + str(summary['end']) + ' (' + str(summary['searches']) +
+                  ' searched) in ' + str(round(summary['wall_time'], 1)) + ' s, ' + str(summary['events']) +
+                  ' events')
@@ -0,0 +1,224 @@
+import struct
+from typing import List, Optional
+
+import numpy as np
+
+from src.models.CardSet import RANK_NAMES, SUIT_NAMES
+
+SNAPSHOT_MAGIC = b'BJGS'
+SNAPSHOT_VERSION = 1
+
+GAME = struct.Struct('<iiiB')  # frame, elapsed, zeros_since (-1 when None) and GAME_FLAGS as bits
+GAME_FLAGS = ('was_reverse_puted', 'was_reverse_inverted', 'temp', 'game_ended', 'end_of_dealing')
+PLAYER = struct.Struct('<iiiiiB')  # prev_points, points, coins, total_cards, prev_total_cards and PLAYER_FLAGS
+PLAYER_FLAGS = ('busted', 'raised', 'soft', 'blackjack')
+TABLE = struct.Struct('<iBiI')  # frames, new_game, time of winners and hand_count
+
+# Fixed part of a card, its outline and corners follow as int16 and float32 points of all cards
+CARD = np.dtype([('center', '<i4', 2), ('width', '<i4'), ('height', '<i4'), ('rank', 'u1'), ('suit', 'u1'),
+                 ('rank_diff', '<i4'), ('suit_diff', '<i4'), ('confidence', '<f8'), ('margin', '<f8'),
+                 ('size', '<f8'), ('track_id', '<i4'), ('age', '<i4'), ('contour', '<u2'), ('corners', 'u1')])
+COIN = np.dtype([('pos', '<i4', 3), ('coin_id', '<i4')])
+REF = np.dtype('<i2')
+U8 = struct.Struct('<B')
+U16 = struct.Struct('<H')
+U32 = struct.Struct('<I')
+I32 = struct.Struct('<i')
+
+
+class Writer:
+    """Collects parts of a snapshot."""
+
+    def __init__(self):
+        self.parts = []
+
+    def pack(self, layout: struct.Struct, *values) -> None:
+        self.parts.append(layout.pack(*values))
+
+    def text(self, text: str) -> None:
+        data = text.encode()
+        self.parts.append(U16.pack(len(data)) + data)
+
+    def array(self, array: np.ndarray) -> None:
+        self.parts.append(U16.pack(len(array)) + array.tobytes())
+
+    def bytes(self) -> bytes:
+        return b''.join(self.parts)
+
+
+class Reader:
+    """Reads parts of a snapshot in the order they were written."""
+
+    def __init__(self, data: bytes, pos: int = 0):
+        self.data = data
+        self.pos = pos
+
+    def unpack(self, layout: struct.Struct) -> tuple:
+        values = layout.unpack_from(self.data, self.pos)
+        self.pos += layout.size
+        return values
+
+    def text(self) -> str:
+        length, = self.unpack(U16)
+        self.pos += length
+        return self.data[self.pos - length:self.pos].decode()
+
+    def array(self, dtype: np.dtype, count: Optional[int] = None) -> np.ndarray:
+        if count is None:
+            count, = self.unpack(U16)
+        array = np.frombuffer(self.data, dtype, count, self.pos)
+        self.pos += count * dtype.itemsize
+        return array
+
+
+def check_header(reader: Reader) -> None:
+    data = reader.data
+    if data[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC or data[len(SNAPSHOT_MAGIC)] != SNAPSHOT_VERSION:
+        raise ValueError('Not a snapshot of version ' + str(SNAPSHOT_VERSION))
+    reader.pos = len(SNAPSHOT_MAGIC) + 1
+
+
+def flags(data: dict, names) -> int:
+    return sum(1 << i for i, name in enumerate(names) if data[name])
+
+
+def read_flags(names, bits: int) -> dict:
+    return {name: bool(bits >> i & 1) for i, name in enumerate(names)}
+
+
+def name_id(names: List[str], name: str) -> int:
+    return names.index(name) if name in names else names.index('Unknown')
+
+
+def optional(value: Optional[int]) -> int:
+    return -1 if value is None else value
+
+
+def read_optional(value: int) -> Optional[int]:
+    return None if value < 0 else int(value)
+
+
+def pack_game(state: dict) -> bytes:
+    """Game state given by Game.state() as small versioned blob. Card outlines go as int16 and corners as
+    float32 points of all cards."""
+    out = Writer()
+    out.parts.append(SNAPSHOT_MAGIC + bytes([SNAPSHOT_VERSION]))
+    out.pack(GAME, optional(state['frame']), state['elapsed'], optional(state['zeros_since']),
+             flags(state, GAME_FLAGS))
+
+    out.pack(U8, len(state['players']))
+    for player in state['players']:
+        out.text(player['name'])
+        out.pack(PLAYER, player['prev_points'], player['points'], player['coins'], player['total_cards'],
+                 player['prev_total_cards'], flags(player, PLAYER_FLAGS))
+        out.array(np.array(player['bet'], dtype='<i4'))
+
+    cards = state['card_list']
+    contours = [np.array(card['contour'], dtype='<i2').reshape(-1, 2) for card in cards]
+    corners = [np.array(card['corner_pts'], dtype='<f4').reshape(-1, 2) for card in cards]
+    table = np.array([(card['center'], card['width'], card['height'], name_id(RANK_NAMES, card['rank']),
+                       name_id(SUIT_NAMES, card['suit']), card['rank_diff'], card['suit_diff'], card['confidence'],
+                       card['margin'], card['size'], optional(card['track_id']), card['age'], len(contour),
+                       len(corner)) for card, contour, corner in zip(cards, contours, corners)], dtype=CARD)
+    out.array(table)
+    out.parts.append(np.concatenate(contours + [np.zeros((0, 2), dtype='<i2')]).tobytes())
+    out.parts.append(np.concatenate(corners + [np.zeros((0, 2), dtype='<f4')]).tobytes())
+    out.array(np.array(state['cards'], dtype=REF))
+    out.array(np.array(state['prev_cards'], dtype=REF))
+    out.pack(U8, (state['deck'] is not None) | (state['reverse'] is not None) << 1)
+    out.array(np.array([state[name] for name in ('deck', 'reverse') if state[name] is not None], dtype=REF))
+
+    out.array(np.array([(coin['pos'], optional(coin['coin_id'])) for coin in state['coin_list']], dtype=COIN))
+    for name in ('coins', 'prev_coins'):
+        out.pack(U8, len(state[name]))
+        for refs in state[name]:
+            out.array(np.array(refs, dtype=REF))
+
+    out.pack(U8, len(state['actions']))
+    for text, until in state['actions']:
+        out.text(text)
+        out.pack(I32, until)
+    out.pack(U8, len(state['actions_to_print']))
+    for text in state['actions_to_print']:
+        out.text(text)
+    return out.bytes()
+
+
+def unpack_game(data: bytes) -> dict:
+    """Game state from blob of pack_game, in the form given by Game.state()."""
+    reader = Reader(data)
+    check_header(reader)
+    frame, elapsed, zeros_since, bits = reader.unpack(GAME)
+    state = {'frame': read_optional(frame), 'elapsed': elapsed, 'zeros_since': read_optional(zeros_since)}
+    state.update(read_flags(GAME_FLAGS, bits))
+
+    state['players'] = []
+    for _ in range(reader.unpack(U8)[0]):
+        player = {'name': reader.text()}
+        player['prev_points'], player['points'], player['coins'], player['total_cards'], \
+            player['prev_total_cards'], player_bits = reader.unpack(PLAYER)
+        player.update(read_flags(PLAYER_FLAGS, player_bits))
+        player['bet'] = reader.array(np.dtype('<i4')).tolist()
+        state['players'].append(player)
+
+    table = reader.array(CARD)
+    contours = reader.array(np.dtype('<i2'), 2 * int(table['contour'].sum())).reshape(-1, 2).tolist()
+    corners = reader.array(np.dtype('<f4'), 2 * int(table['corners'].sum())).reshape(-1, 2).tolist()
+    state['card_list'] = []
+    contour_ends = np.cumsum(table['contour']).tolist()
+    corner_ends = np.cumsum(table['corners']).tolist()
+    for row, contour_end, corner_end in zip(table.tolist(), contour_ends, corner_ends):
+        center, width, height, rank, suit, rank_diff, suit_diff, confidence, margin, size, track_id, age, \
+            contour_len, corners_len = row
+        state['card_list'].append({
+            'contour': contours[contour_end - contour_len:contour_end], 'width': width, 'height': height,
+            'corner_pts': corners[corner_end - corners_len:corner_end], 'center': center.tolist(),
+            'rank': RANK_NAMES[rank], 'suit': SUIT_NAMES[suit], 'rank_diff': rank_diff, 'suit_diff': suit_diff,
+            'confidence': confidence, 'margin': margin, 'size': size, 'track_id': read_optional(track_id),
+            'age': age})
+    state['cards'] = reader.array(REF).tolist()
+    state['prev_cards'] = reader.array(REF).tolist()
+    has, = reader.unpack(U8)
+    deck_refs = reader.array(REF).tolist()
+    state['deck'] = deck_refs.pop(0) if has & 1 else None
+    state['reverse'] = deck_refs.pop(0) if has & 2 else None
+
+    state['coin_list'] = [{'pos': row['pos'].tolist(), 'coin_id': read_optional(row['coin_id'])}
+                          for row in reader.array(COIN)]
+    for name in ('coins', 'prev_coins'):
+        state[name] = [reader.array(REF).tolist() for _ in range(reader.unpack(U8)[0])]
+
+    state['actions'] = []
+    for _ in range(reader.unpack(U8)[0]):
+        text = reader.text()
+        state['actions'].append([text, reader.unpack(I32)[0]])
+    state['actions_to_print'] = [reader.text() for _ in range(reader.unpack(U8)[0])]
+    return state
+
+
+def pack_table(state: dict, seats: List[str]) -> bytes:
+    """Table state given by TableState.state() as blob, winners and hands are stored as seat numbers."""
+    out = Writer()
+    out.parts.append(SNAPSHOT_MAGIC + bytes([SNAPSHOT_VERSION]))
+    out.pack(TABLE, state['frames'], state['new_game'], state['winners']['time'], state['hand_count'])
+    out.array(np.array([seats.index(name) for name in state['winners']['who']], dtype='u1'))
+    out.pack(U16, len(state['hands']))
+    for who in state['hands']:
+        out.array(np.array([seats.index(name) for name in who], dtype='u1'))
+    game = pack_game(state['game']) if state['game'] is not None else b''
+    out.pack(U32, len(game))
+    out.parts.append(game)
+    return out.bytes()
+
+
+def unpack_table(data: bytes, seats: List[str]) -> dict:
+    """Table state from blob of pack_table, in the form given by TableState.state()."""
+    reader = Reader(data)
+    check_header(reader)
+    frames, new_game, time, hand_count = reader.unpack(TABLE)
+    who = [seats[i] for i in reader.array(np.dtype('u1'))]
+    hands = [[seats[i] for i in reader.array(np.dtype('u1'))] for _ in range(reader.unpack(U16)[0])]
+    length, = reader.unpack(U32)
+    game = unpack_game(data[reader.pos:reader.pos + length]) if length > 0 else None
+    return {'frames': frames, 'new_game': bool(new_game), 'winners': {'who': who, 'time': time}, 'hands': hands,
+            'hand_count': hand_count, 'game': game}
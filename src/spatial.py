@@ -0,0 +1,77 @@
+from typing import Tuple
+
+import numpy as np
+from numpy import ndarray
+
+NO_POINT = 10000  # distance given when there is nothing to be near to
+
+
+def pairwise_distances(a: ndarray, b: ndarray) -> ndarray:
+    """len(a) x len(b) euclidean distances between rows of two arrays of (x, y) points."""
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 2)
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 2)
+    dx = a[:, None, 0] - b[None, :, 0]
+    dy = a[:, None, 1] - b[None, :, 1]
+    return np.sqrt(dx * dx + dy * dy)
+
+
+def greedy_pairs(distances: ndarray, max_distance: float) -> ndarray:
+    """One to one pairing of rows with columns, starting from the closest pair. Returns paired
+    column of every row, -1 when row was left without one (nothing free within max_distance)."""
+    pairs = np.full(distances.shape[0], -1, dtype=np.intp)
+    used = np.zeros(distances.shape[1], dtype=bool)
+    for flat in np.argsort(distances, axis=None, kind='stable'):
+        i, j = np.unravel_index(flat, distances.shape)
+        if distances[i, j] > max_distance:
+            break
+        if pairs[i] < 0 and not used[j]:
+            pairs[i] = j
+            used[j] = True
+    return pairs
+
+
+def restore_nearest(old: ndarray, new: ndarray, query: ndarray, far: float,
+                    one_to_one: bool = False) -> Tuple[ndarray, ndarray]:
+    """Nearest points for restoring old detections that are missing among new ones.
+
+    Old points of query are taken in order, each is compared with new points and with old points
+    restored before it, and is restored when nothing is closer than far. Returns distance and index
+    of nearest point of every old one, indices are to list of new points followed by restored ones
+    (as they are appended), and -1 for restored points and points not in query. All distances
+    are computed at once, in one matrix.
+
+    With one_to_one, new point can be nearest to only one old point: they are paired greedily from
+    the closest pair, and old points left without pair are restored."""
+
+    n = len(new)
+    distances = pairwise_distances(old, np.concatenate([np.asarray(new, dtype=np.float64).reshape(-1, 2),
+                                                        np.asarray(old, dtype=np.float64).reshape(-1, 2)]))
+    nearest = np.full(len(query), NO_POINT, dtype=np.float64)
+    index = np.full(len(query), -1, dtype=np.intp)
+    rows = np.flatnonzero(query)
+
+    if one_to_one:
+        pairs = greedy_pairs(distances[rows, :n], far)
+        paired = pairs >= 0
+        nearest[rows[paired]] = distances[rows[paired], pairs[paired]]
+        index[rows[paired]] = pairs[paired]
+        return nearest, index
+
+    if n > 0:
+        closest = np.argmin(distances[:, :n], axis=1)
+        closest_distance = distances[np.arange(len(old)), closest]
+    restored = []  # old points appended so far
+    for j in rows:
+        dist, k = NO_POINT, -1
+        if n > 0 and closest_distance[j] < dist:
+            dist, k = closest_distance[j], closest[j]
+        if len(restored) > 0:
+            others = distances[j, n + np.array(restored)]
+            m = int(np.argmin(others))
+            if others[m] < dist:  # new points come first, so they win ties
+                dist, k = others[m], n + m
+        if dist > far:
+            restored.append(j)
+            dist, k = NO_POINT, -1
+        nearest[j], index[j] = dist, k
+    return nearest, index
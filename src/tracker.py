@@ -0,0 +1,124 @@
+from typing import Dict, List
+
+import cv2
+import numpy as np
+from numpy import ndarray
+
+from config import *
+from src.extractor import CornerExtractor
+from src.helpers import match_cards
+from src.models.QueryCard import QueryCard
+from src.models.TemplateBank import TemplateBank
+from src.models.Track import Track
+from src.profiling import timed
+
+
+def rect_iou(a: ndarray, b: ndarray) -> ndarray:
+    """Intersection over union of every rectangle (x, y, w, h) in a with every one in b."""
+    x0 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y0 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x1 = np.minimum(a[:, None, 0] + a[:, None, 2], b[None, :, 0] + b[None, :, 2])
+    y1 = np.minimum(a[:, None, 1] + a[:, None, 3], b[None, :, 1] + b[None, :, 3])
+    inter = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+    area_a = a[:, 2] * a[:, 3]
+    area_b = b[:, 2] * b[:, 3]
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1)
+
+
+def corners_moved(card: QueryCard, ref: QueryCard) -> float:
+    """Largest distance from corner of card to the closest corner of ref."""
+    pts = card.corner_pts.reshape(-1, 2)
+    ref_pts = ref.corner_pts.reshape(-1, 2)
+    dist = np.linalg.norm(pts[:, None] - ref_pts[None], axis=2)
+    return float(dist.min(axis=1).max())
+
+
+def is_confident(match) -> bool:
+    rank, suit, rank_diff, suit_diff, confidence, margin = match
+    return rank != "Unknown" and suit != "Unknown" and confidence > TRACK_MIN_CONFIDENCE and margin >= TRACK_MIN_MARGIN
+
+
+class CardTracker:
+    """Follows cards between searches by their position. Card is warped and matched again only when
+    it is new, has moved, was not matched confidently, or was not matched for TRACK_REFRESH searches.
+    Other cards take rank and suit from their track."""
+
+    def __init__(self):
+        self.tracks: Dict[int, Track] = {}
+        self.next_id = 0
+        self.matched = 0  # cards matched so far
+        self.reused = 0  # cards that took match from their track
+        self.extractor = CornerExtractor()
+
+    def assign(self, cards: List[QueryCard]) -> List[Track]:
+        """Greedily pairs cards with tracks, starting from the biggest overlap."""
+        assigned = [None] * len(cards)
+        tracks = list(self.tracks.values())
+        if len(cards) == 0 or len(tracks) == 0:
+            return assigned
+
+        card_rects = np.array([cv2.boundingRect(card.contour) for card in cards], dtype=np.float64)
+        track_rects = np.array([cv2.boundingRect(track.card.contour) for track in tracks], dtype=np.float64)
+        iou = rect_iou(card_rects, track_rects)
+        used = set()
+        for flat in np.argsort(-iou, axis=None):
+            i, j = np.unravel_index(flat, iou.shape)
+            if iou[i, j] < TRACK_MIN_IOU:
+                break
+            if assigned[i] is None and j not in used:
+                assigned[i] = tracks[j]
+                used.add(j)
+        return assigned
+
+    @timed('track_cards')
+    def update(self, cards: List[QueryCard], image: ndarray, frame: int, rank_bank: TemplateBank,
+               suit_bank: TemplateBank) -> List[QueryCard]:
+        """Fills cards found in this search (with geometry only) with rank and suit either
+        matched now or taken from their tracks, and sets their track ids and ages."""
+
+        assigned = self.assign(cards)
+
+        to_match = []
+        fresh = []  # whether card is matched in this search
+        for card, track in zip(cards, assigned):
+            if track is not None and track.since_match < TRACK_REFRESH and is_confident(track.match) \
+                    and corners_moved(card, track.card) <= TRACK_MOVE_PX:
+                card.warp, card.rank_img, card.suit_img = track.card.warp, track.card.rank_img, track.card.suit_img
+                card.best_rank_match, card.best_suit_match, card.rank_diff, card.suit_diff, card.confidence, \
+                    card.margin = track.match
+                track.since_match += 1
+                self.reused += 1
+                fresh.append(False)
+            else:
+                to_match.append(card)
+                fresh.append(True)
+
+        # warp corners of all cards that need it, and score them against all templates at once
+        self.extractor.extract(to_match, image)
+        for card, match in zip(to_match, match_cards(to_match, rank_bank, suit_bank)):
+            card.best_rank_match, card.best_suit_match, card.rank_diff, card.suit_diff, card.confidence, \
+                card.margin = match
+        self.matched += len(to_match)
+
+        seen = set()
+        for card, track, is_fresh in zip(cards, assigned, fresh):
+            match = (card.best_rank_match, card.best_suit_match, card.rank_diff, card.suit_diff, card.confidence,
+                     card.margin)
+            if track is None:
+                track = Track(self.next_id, card, match, frame)
+                self.tracks[track.track_id] = track
+                self.next_id += 1
+            elif is_fresh:
+                track.card, track.match, track.since_match = card, match, 0
+            track.last_seen = frame
+            track.misses = 0
+            seen.add(track.track_id)
+            card.track_id = track.track_id
+            card.age = frame - track.first_seen
+
+        for track_id in list(self.tracks):
+            if track_id not in seen:
+                self.tracks[track_id].misses += 1
+                if self.tracks[track_id].misses > TRACK_MAX_MISSES:
+                    del self.tracks[track_id]
+        return cards
@@ -0,0 +1,217 @@
+import argparse
+import multiprocessing as mp
+import queue
+import time
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+from numpy import ndarray
+
+from config import *
+from src.helpers import preprocess_image, find_cards
+
+END = -1  # frame number written to slot after last frame
+HEADER = 2  # int64 fields before frame numbers of slots: frames copied by capture, frames released by detection
+
+
+class FrameRing:
+    """Ring of preallocated frame slots in shared memory, for one capture and one detection process.
+    Capture decodes straight into free slot, detection works on NumPy view of filled slot, so frames
+    are never pickled or copied between processes. Slots are handed over with two semaphores
+    (free and filled slots), which also order memory writes between processes."""
+
+    def __init__(self, slots: int, shape: Tuple[int, ...], name: Optional[str] = None, free=None, filled=None):
+        self.slots = slots
+        self.shape = tuple(shape)
+        frame_size = int(np.prod(self.shape))
+        header_size = (HEADER + slots) * 8
+        create = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=header_size + slots * frame_size)
+        self.header = np.ndarray((HEADER + slots,), dtype=np.int64, buffer=self.shm.buf)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=self.shm.buf, offset=header_size)
+        if create:
+            self.header[:] = 0
+        self.free = mp.Semaphore(slots) if free is None else free
+        self.filled = mp.Semaphore(0) if filled is None else filled
+        self.position = 0  # next slot of this side of the ring
+
+    def __getstate__(self):
+        # only name of shared memory goes to other process, views are made again there
+        return self.slots, self.shape, self.shm.name, self.free, self.filled
+
+    def __setstate__(self, state):
+        slots, shape, name, free, filled = state
+        self.__init__(slots, shape, name, free, filled)
+
+    @property
+    def copies(self) -> int:
+        return int(self.header[0])
+
+    @property
+    def released(self) -> int:
+        return int(self.header[1])
+
+    def acquire_free(self) -> ndarray:
+        """Waits for free slot and returns view to write next frame into."""
+        self.free.acquire()
+        return self.frames[self.position % self.slots]
+
+    def publish(self, frame_number: int) -> None:
+        """Hands slot from acquire_free to detection."""
+        self.header[HEADER + self.position % self.slots] = frame_number
+        self.position += 1
+        self.filled.release()
+
+    def acquire_filled(self) -> Tuple[int, ndarray]:
+        """Waits for next frame, returns its number (END after last frame) and view of it."""
+        self.filled.acquire()
+        slot = self.position % self.slots
+        return int(self.header[HEADER + slot]), self.frames[slot]
+
+    def release(self) -> None:
+        """Gives slot from acquire_filled back to capture."""
+        self.position += 1
+        self.header[1] += 1
+        self.free.release()
+
+    def close(self, unlink: bool = False) -> None:
+        del self.header, self.frames  # views have to go before memory is closed
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def frame_shape(path: str) -> Tuple[int, int, int]:
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise FileNotFoundError('Video ' + path + ' was not found')
+    shape = (int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), 3)
+    cap.release()
+    return shape
+
+
+def detect(frame: ndarray, detection: bool) -> int:
+    """Work done by detection process on frame: thresholding and card contours, or only a look at it."""
+    if detection:
+        return len(find_cards(preprocess_image(frame, PYRAMID_SCALE), PYRAMID_SCALE))
+    return int(frame[::64, ::64, 0].sum() > 0)
+
+
+def ring_capture(path: str, ring: FrameRing, max_frames: Optional[int]) -> None:
+    cap = cv2.VideoCapture(path)
+    count = 0
+    while True:
+        slot = ring.acquire_free()
+        if max_frames is not None and count >= max_frames:
+            break
+        ret, frame = cap.read(slot)  # decodes into slot when it has the size of video
+        if not ret:
+            break
+        if not np.shares_memory(frame, slot):
+            slot[:] = frame
+            ring.header[0] += 1
+        count += 1
+        ring.publish(count)
+    cap.release()
+    ring.publish(END)  # last acquired slot carries only end marker
+    ring.close()
+
+
+def ring_detect(ring: FrameRing, detection: bool, results) -> None:
+    found = count = 0
+    while True:
+        frame_number, frame = ring.acquire_filled()
+        if frame_number == END:
+            break
+        found += detect(frame, detection)
+        count += 1
+        ring.release()
+    results.put((count, found))
+    ring.close()
+
+
+def queue_capture(path: str, frames: mp.Queue, max_frames: Optional[int]) -> None:
+    cap = cv2.VideoCapture(path)
+    count = 0
+    while max_frames is None or count < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        count += 1
+        frames.put((count, frame))  # pickled and copied through pipe
+    cap.release()
+    frames.put((END, None))
+
+
+def queue_detect(frames: mp.Queue, detection: bool, results) -> None:
+    found = count = 0
+    while True:
+        frame_number, frame = frames.get()
+        if frame_number == END:
+            break
+        found += detect(frame, detection)
+        count += 1
+    results.put((count, found))
+
+
+def run_transport(path: str, transport: str = 'shm', slots: int = 4, max_frames: Optional[int] = None,
+                  detection: bool = True) -> dict:
+    """Runs capture and detection of video in two processes, connected with shared memory ring ('shm')
+    or pickling queue ('queue') of the same size. Returns frames per second and frame copies made
+    between decoding and detection. Ring counts its copies. Copies of queue are not measured, they are
+    estimated as two per frame (pickling and unpickling, not counting the pipe), and copies_estimated is set."""
+
+    results = mp.Queue()
+    ring = None
+    if transport == 'shm':
+        ring = FrameRing(slots, frame_shape(path))
+        capture = mp.Process(target=ring_capture, args=(path, ring, max_frames))
+        detector = mp.Process(target=ring_detect, args=(ring, detection, results))
+    else:
+        frames = mp.Queue(maxsize=slots)
+        capture = mp.Process(target=queue_capture, args=(path, frames, max_frames))
+        detector = mp.Process(target=queue_detect, args=(frames, detection, results))
+
+    start = time.perf_counter()
+    capture.start()
+    detector.start()
+    while True:
+        try:
+            count, found = results.get(timeout=1)
+            break
+        except queue.Empty:
+            if not detector.is_alive() or capture.exitcode not in (None, 0):
+                capture.terminate()
+                detector.terminate()
+                if ring is not None:
+                    ring.close(unlink=True)
+                raise RuntimeError('Capture or detection process of ' + path + ' has failed')
+    capture.join()
+    detector.join()
+    wall = time.perf_counter() - start
+
+    if ring is not None:
+        copies = ring.copies
+        ring.close(unlink=True)
+    else:
+        copies = 2 * count
+    return {'transport': transport, 'frames': count, 'wall_time': wall, 'fps': count / wall if wall > 0 else 0.0,
+            'copies': copies, 'copies_estimated': ring is None, 'cards': found}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare shared memory ring with queue for passing frames '
+                                                 'from capture to detection process.')
+    parser.add_argument('video')
+    parser.add_argument('--frames', type=int, default=None, help='stop after this many frames')
+    parser.add_argument('--slots', type=int, default=4, help='frames in flight between processes')
+    parser.add_argument('--transport-only', action='store_true', help='detection process only looks at frames')
+    args = parser.parse_args()
+
+    for transport in ('queue', 'shm'):
+        result = run_transport(args.video, transport, args.slots, args.frames, not args.transport_only)
+        print(transport + ': ' + str(result['frames']) + ' frames in ' + str(round(result['wall_time'], 2)) +
+              ' s (' + str(round(result['fps'], 1)) + ' fps), ' + str(result['copies']) + ' frame copies' +
+              (' (estimated)' if result['copies_estimated'] else ''))
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# modules of src import each other both as src.x and as x (see src/main.py)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'src')]
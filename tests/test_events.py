@@ -0,0 +1,36 @@
+import pytest
+
+from src.events import BinarySink, read_binary_events
+from src.models.GameEvent import GameEvent
+
+
+def write(path: str, events, append: bool = True) -> None:
+    sink = BinarySink(str(path), append)
+    for event in events:
+        sink.write(event)
+    sink.close()
+
+
+def test_binary_events_round_trip(tmp_path):
+    path = tmp_path / 'events.bin'
+    events = [GameEvent('deal', 1, 0.5, 'Player1', [('Ace', 'Spades'), ('Ten', 'Hearts')], 21, 3),
+              GameEvent('new_game', 30, 1.0), GameEvent('win', 45, 1.5, 'P' * 300)]
+    write(path, events[:2])
+    write(path, events[2:])  # appended to the same file
+    assert [event.to_dict() for event in read_binary_events(str(path))] == [event.to_dict() for event in events]
+
+
+def test_binary_sink_does_not_append_to_other_file(tmp_path):
+    path = tmp_path / 'events.bin'
+    path.write_text('{"kind": "deal"}\n')
+    with pytest.raises(ValueError):
+        BinarySink(str(path))
+
+
+@pytest.mark.parametrize('size', [0, 3, -1])  # empty, part of magic, last byte missing
+def test_read_binary_events_rejects_empty_or_truncated_file(tmp_path, size):
+    path = tmp_path / 'events.bin'
+    write(path, [GameEvent('deal', 1, 0.5, 'Player1', [('Ace', 'Spades')], 11)])
+    path.write_bytes(path.read_bytes()[:size])
+    with pytest.raises(ValueError):
+        read_binary_events(str(path))
@@ -0,0 +1,21 @@
+from src.models.TableLayout import TableLayout, SHOE, HOLE, DISCARD
+
+DEALER = [(0, 0), (999, 0), (999, 499), (0, 499)]
+PLAYER = [(0, 500), (999, 500), (999, 999), (0, 999)]
+
+
+def spec(**zones) -> dict:
+    return dict({'seats': [{'name': 'Dealer', 'polygon': DEALER}, {'name': 'Player1', 'polygon': PLAYER}]}, **zones)
+
+
+def test_shoe_inside_dealer_seat_belongs_to_shoe():
+    layout = TableLayout(spec(shoe=[(100, 100), (200, 100), (200, 200), (100, 200)]))
+    assert layout.zone_of([(150, 150), (100, 100), (300, 300)]).tolist() == [SHOE, SHOE, 0]
+
+
+def test_zones_win_in_order_shoe_hole_discard_seats():
+    layout = TableLayout(spec(shoe=[(100, 100), (200, 100), (200, 200), (100, 200)],
+                              hole=[(150, 150), (300, 150), (300, 300), (150, 300)],
+                              discard=[(250, 250), (400, 250), (400, 600), (250, 600)]))
+    assert layout.zone_of([(175, 175), (280, 280), (350, 350), (350, 550), (350, 700)]).tolist() == \
+        [SHOE, HOLE, DISCARD, DISCARD, 1]
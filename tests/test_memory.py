@@ -0,0 +1,74 @@
+import gc
+import os
+import tracemalloc
+from collections import deque
+
+from src.config import *
+from src.main import next_frame, update_winners
+from src.models.CardSet import CardSet
+from src.models.QueryCard import QueryCard
+from src.models.TableState import TableState
+
+PASSES = int(os.environ.get('MEMORY_PASSES', 5000))  # MEMORY_PASSES=1000000 for a soak run
+WARMUP = PASSES // 4  # passes before memory is measured, deques fill up during them
+MAX_GROWTH = 64 * 1024  # bytes
+
+DEALER, PLAYER1, PLAYER2 = (1400, 800), (400, 300), (1400, 300)
+
+
+def card(rank: str, suit: str, center, shift: int = 0) -> QueryCard:
+    q_card = QueryCard()
+    q_card.center = [center[0] + shift, center[1]]
+    q_card.size = 100000
+    q_card.best_rank_match, q_card.best_suit_match = rank, suit
+    return q_card
+
+
+def hand(layout):
+    """Searches of one synthetic hand: dealing, blackjack of Player1, dealer standing on 17, empty table."""
+    searches = [
+        [card('Ten', 'Hearts', PLAYER1), card('Nine', 'Clubs', PLAYER2), card('Seven', 'Spades', DEALER)],
+        [card('Ten', 'Hearts', PLAYER1), card('Ace', 'Clubs', PLAYER1, 50), card('Nine', 'Clubs', PLAYER2),
+         card('Seven', 'Spades', DEALER)],
+        [card('Ten', 'Hearts', PLAYER1), card('Ace', 'Clubs', PLAYER1, 50), card('Nine', 'Clubs', PLAYER2),
+         card('Five', 'Hearts', PLAYER2, 50), card('Seven', 'Spades', DEALER), card('King', 'Spades', DEALER, 50)],
+    ]
+    empty = [[]] * (NEW_GAME_FRAMES // SEARCH_INTERVAL + 1)  # noone has points, so new game starts
+    return [CardSet(cards, layout) for cards in searches + empty]
+
+
+def run(table: TableState, searches, start: int, stop: int) -> None:
+    for i in range(start, stop):
+        game = next_frame(table, i * SEARCH_INTERVAL + 1)
+        game.set_frame(table.frames)
+        game.cards = searches[i % len(searches)]
+        game.count_cards()
+        game.search_action()
+        game.set_prev()
+        game.set_points()
+        game.add_action('secret_card')  # table action, so every pass adds one
+        update_winners(table)
+
+
+def test_memory_stays_flat():
+    table = TableState(None, None)
+    searches = hand(table.layout)
+    # short runs keep fewer hands, so that history is full before memory is measured
+    history = min(HAND_HISTORY, WARMUP // len(searches) - 1)
+    table.hands = deque(maxlen=history)
+
+    tracemalloc.start()
+    try:
+        run(table, searches, 0, WARMUP)
+        gc.collect()
+        before = tracemalloc.get_traced_memory()[0]
+        run(table, searches, WARMUP, PASSES)
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    assert table.hand_count > history  # history was full
+    assert len(table.hands) <= history
+    assert len(table.game.actions) <= ACTION_HISTORY
+    assert after - before < MAX_GROWTH